@@ -1,12 +1,96 @@
+import json
+
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
 from .models import Product, PickupPoint, Order, Profile
+from .prices import PRICE_BUCKET_BOUNDS, price_range_label
+from .search import search_products
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор админки для больших таблиц.
+
+    На PostgreSQL число строк берётся из статистики планировщика: для
+    всей таблицы — pg_class.reltuples, для отфильтрованного списка — оценка
+    EXPLAIN. Точный COUNT(*) выполняется, только если строк меньше
+    EXACT_COUNT_LIMIT (тогда он дешёвый).
+    """
+
+    EXACT_COUNT_LIMIT = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+        estimate = self.estimate(queryset, connection)
+        if estimate is None or estimate < self.EXACT_COUNT_LIMIT:
+            return super().count
+        return estimate
+
+    @staticmethod
+    def estimate(queryset, connection):
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [connection.ops.quote_name(queryset.model._meta.db_table)],
+                )
+                row = cursor.fetchone()
+                # -1: таблицу ещё не анализировали
+                return row[0] if row and row[0] >= 0 else None
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без точных COUNT(*) по всей таблице"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class PriceRangeFilter(admin.SimpleListFilter):
+    """Фильтр по диапазонам цен (без SELECT DISTINCT по всем ценам)"""
+    title = 'цена'
+    parameter_name = 'price_range'
+    # Те же диапазоны, что у фильтра каталога (bodies.prices)
+    RANGES = [
+        (f'{lower:.0f}-{upper:.0f}' if upper is not None else f'{lower:.0f}-',
+         price_range_label(lower, upper), lower, upper)
+        for lower, upper in zip(PRICE_BUCKET_BOUNDS, PRICE_BUCKET_BOUNDS[1:] + [None])
+    ]
+
+    def lookups(self, request, model_admin):
+        return [(key, label) for key, label, _, _ in self.RANGES]
+
+    def queryset(self, request, queryset):
+        for key, _, low, high in self.RANGES:
+            if self.value() == key:
+                queryset = queryset.filter(price__gte=low)
+                if high is not None:
+                    queryset = queryset.filter(price__lt=high)
+                return queryset
+        return queryset
 
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ('name', 'sku', 'price', 'has_image')
-    search_fields = ('name', 'sku')
-    list_filter = ('price',)
+    # Поиск: точный артикул (уникальный индекс) или полнотекстовый/триграммный
+    # поиск по названию и описанию (GIN-индексы), см. get_search_results
+    search_fields = ('sku', 'name')
+    search_help_text = 'Артикул целиком или слова из названия и описания'
+    list_filter = (PriceRangeFilter,)
+    ordering = ('-id',)
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'sku', 'price')
@@ -15,7 +99,16 @@ class ProductAdmin(admin.ModelAdmin):
             'fields': ('description', 'image')
         }),
     )
-    
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        by_sku = queryset.filter(sku=term)
+        if by_sku.exists():
+            return by_sku, False
+        return search_products(queryset, term), False
+
     def has_image(self, obj):
         """Показать галочку если есть изображение"""
         return bool(obj.image)
@@ -26,17 +119,36 @@ class ProductAdmin(admin.ModelAdmin):
 @admin.register(PickupPoint)
 class PickupPointAdmin(admin.ModelAdmin):
     list_display = ('address',)
+    search_fields = ('address',)
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'status', 'createdAt', 'receiveCode')
+    list_select_related = ('user',)
     list_filter = ('status', 'createdAt')
-    search_fields = ('user__username', 'receiveCode')
+    # Точное совпадение: логин — индекс auth_user_username_prefix_idx,
+    # код получения — order_receive_code_upper_idx (миграции 0009, 0010)
+    search_fields = ('=user__username', '=receiveCode')
+    search_help_text = 'Логин покупателя или код получения целиком'
+    # Сортировка по первичному ключу идёт по индексу; порядок тот же, что по дате
+    ordering = ('-id',)
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('products', 'pickupPoint')
     readonly_fields = ('createdAt', 'receiveCode')
+    actions = ['mark_delivered']
+
+    @admin.action(description='Отметить выданными')
+    def mark_delivered(self, request, queryset):
+        """Выдать выбранные заказы одним UPDATE"""
+        count = queryset.mark_delivered()
+        self.message_user(request, f'Выдано заказов: {count}')
 
 
 @admin.register(Profile)
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(LargeTableAdmin):
     list_display = ('user', 'role')
+    list_select_related = ('user',)
     list_filter = ('role',)
+    search_fields = ('^user__username',)
+    raw_id_fields = ('user',)
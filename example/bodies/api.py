@@ -0,0 +1,195 @@
+"""
+JSON API каталога (только чтение).
+
+    GET /api/products/?fields=id,name,price&per_page=500&after=<курсор>
+    GET /api/products/?search=чайник&price_min=100&price_max=500
+    GET /api/products/<id>/
+    GET /api/pickup-points/
+
+Список товаров:
+
+- курсорная пагинация: ``{"results": [...], "next": "<курсор>"}``, курсор
+  передаётся в ``after``; ``per_page`` до API_MAX_PAGE_SIZE;
+- ``fields`` — какие поля отдавать (по умолчанию DEFAULT_FIELDS);
+- строки читаются через ``.values().iterator()`` и сериализуются потоком,
+  без создания объектов модели и без сборки всей страницы в памяти (под
+  ASGI — через ``.aiterator()``);
+- ETag и Last-Modified строятся из версии каталога (bodies.catalog), поэтому
+  повторный опрос неизменившегося каталога получает 304, не читая товары.
+"""
+
+import json
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .catalog import catalog_version, version_datetime
+from .models import PickupPoint, Product
+from .pagination import KeysetPaginator, get_per_page
+from .search import filter_catalog
+
+PRODUCT_FIELDS = ('id', 'name', 'sku', 'price', 'description', 'image', 'version')
+DEFAULT_FIELDS = ('id', 'name', 'sku', 'price', 'image')
+
+# Строк за одно обращение к курсору БД и строк в одном куске ответа
+STREAM_CHUNK_SIZE = 500
+WRITE_EVERY = 100
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def parse_fields(request):
+    """Поля из параметра ``fields``; None, если есть неизвестные"""
+    value = request.GET.get('fields', '')
+    if not value:
+        return DEFAULT_FIELDS
+    fields = tuple(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    if not fields or any(name not in PRODUCT_FIELDS for name in fields):
+        return None
+    return fields
+
+
+def present(row, fields):
+    """Строка из .values() -> объект ответа с нужными полями"""
+    item = {name: row[name] for name in fields}
+    if 'image' in item:
+        item['image'] = default_storage.url(item['image']) if item['image'] else None
+    return item
+
+
+def encode(item):
+    return json.dumps(item, cls=DjangoJSONEncoder, ensure_ascii=False)
+
+
+def validators(version):
+    """ETag и Last-Modified для версии каталога или товара"""
+    return {
+        'ETag': quote_etag(f'{version:x}'),
+        'Last-Modified': http_date(int(version_datetime(version).timestamp())),
+    }
+
+
+def not_modified_response(request, version):
+    """Ответ 304 (или 412) по If-None-Match / If-Modified-Since; None — отдать данные"""
+    headers = validators(version)
+    response = get_conditional_response(
+        request, etag=headers['ETag'], last_modified=int(version_datetime(version).timestamp()),
+    )
+    if response is not None:
+        for name, value in headers.items():
+            response.headers[name] = value
+    return response
+
+
+class ProductStream:
+    """Страница товаров в JSON по частям: сначала строки, в конце курсор"""
+
+    def __init__(self, paginator, fields):
+        self.paginator = paginator
+        self.fields = fields
+        self.buffer = ['{"results":[']
+        self.count = 0
+        self.last_row = None
+        self.has_next = False
+
+    def add(self, row):
+        """Добавить строку; False — это лишняя строка, т. е. есть следующая страница"""
+        if self.count == self.paginator.per_page:
+            self.has_next = True
+            return False
+        if self.count:
+            self.buffer.append(',')
+        self.buffer.append(encode(present(row, self.fields)))
+        self.count += 1
+        self.last_row = row
+        return True
+
+    def flush(self):
+        chunk = ''.join(self.buffer)
+        self.buffer = []
+        return chunk
+
+    def finish(self):
+        cursor = self.paginator.cursor_for_row(self.last_row) if self.has_next else None
+        self.buffer.append('],"next":' + json.dumps(cursor) + '}')
+        return self.flush()
+
+    def stream(self, rows):
+        for row in rows:
+            if not self.add(row):
+                break
+            if self.count % WRITE_EVERY == 0:
+                yield self.flush()
+        yield self.finish()
+
+    async def astream(self, rows):
+        async for row in rows:
+            if not self.add(row):
+                break
+            if self.count % WRITE_EVERY == 0:
+                yield self.flush()
+        yield self.finish()
+
+
+@require_safe
+def products(request):
+    """Список товаров: курсорная пагинация, выбор полей, потоковая выдача"""
+    fields = parse_fields(request)
+    if fields is None:
+        return error(f'fields: допустимые поля — {", ".join(PRODUCT_FIELDS)}')
+
+    version = catalog_version()
+    not_modified = not_modified_response(request, version)
+    if not_modified is not None:
+        return not_modified
+
+    queryset, ordering = filter_catalog(Product.objects.all(), request.GET)
+    per_page = get_per_page(request, maximum=settings.API_MAX_PAGE_SIZE)
+    paginator = KeysetPaginator(queryset, ordering, per_page)
+    keys = [name for name, _ in paginator.keys]
+    rows = paginator.forward_queryset(request.GET.get('after')).values(*dict.fromkeys([*fields, *keys]))
+
+    stream = ProductStream(paginator, fields)
+    if isinstance(request, ASGIRequest):
+        # Под ASGI синхронный итератор был бы прочитан целиком до отправки
+        content = stream.astream(rows.aiterator(chunk_size=STREAM_CHUNK_SIZE))
+    else:
+        content = stream.stream(rows.iterator(chunk_size=STREAM_CHUNK_SIZE))
+    return StreamingHttpResponse(content, content_type='application/json', headers=validators(version))
+
+
+@require_safe
+def product_detail(request, product_id):
+    """Один товар; ETag — версия товара"""
+    fields = parse_fields(request)
+    if fields is None:
+        return error(f'fields: допустимые поля — {", ".join(PRODUCT_FIELDS)}')
+
+    version = Product.objects.filter(pk=product_id).values_list('version', flat=True).first()
+    if version is None:
+        raise Http404('Товар не найден')
+    not_modified = not_modified_response(request, version)
+    if not_modified is not None:
+        return not_modified
+
+    row = Product.objects.filter(pk=product_id).values(*fields).first()
+    if row is None:
+        raise Http404('Товар не найден')
+    return JsonResponse(present(row, fields), headers=validators(version), json_dumps_params={'ensure_ascii': False})
+
+
+@require_safe
+def pickup_points(request):
+    """Все пункты выдачи; ETag — хэш ответа (таблица маленькая)"""
+    points = list(PickupPoint.objects.order_by('id').values('id', 'address'))
+    response = JsonResponse({'results': points}, json_dumps_params={'ensure_ascii': False})
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
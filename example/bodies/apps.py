@@ -7,3 +7,6 @@ class BodiesConfig(AppConfig):
     
     def ready(self):
         import bodies.signals
+        from django.db.backends.signals import connection_created
+        from .metrics import install_query_counter
+        connection_created.connect(install_query_counter, dispatch_uid='bodies_metrics_query_counter')
@@ -0,0 +1,160 @@
+"""
+Замеры производительности представлений и импорта.
+
+Используются тестом ``BenchmarkTests`` (bodies/tests.py), который
+запускается только с ``BENCHMARK=1``:
+
+    BENCHMARK=1 python manage.py test bodies.tests.BenchmarkTests
+    BENCHMARK=1 BENCH_SCALE=1 python manage.py test bodies.tests.BenchmarkTests  # полный объём
+
+Для каждого сценария считаются p50/p95 времени ответа, пропускная
+способность и число SQL-запросов. Результаты сравниваются с базовыми из
+benchmark_baseline.json (отдельно для каждой СУБД и масштаба); тест
+падает, если запросов стало больше или время выросло больше чем на
+BENCH_TOLERANCE. ``BENCHMARK_UPDATE=1`` записывает текущие результаты
+как новые базовые. В репозитории лежат базовые результаты для масштаба по
+умолчанию на SQLite; если для текущей СУБД и масштаба (или для сценария)
+их нет, тест падает и просит их записать — например, для PostgreSQL на
+машине, где идут замеры.
+
+Итоги замеров пишутся в лог ``bodies.benchmarks`` (уровень INFO).
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from pathlib import Path
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+BASELINE_PATH = Path(__file__).with_name('benchmark_baseline.json')
+
+# Полный объём данных (BENCH_SCALE=1)
+FULL_VOLUMES = {
+    'products': 500_000,
+    'orders': 1_000_000,
+    'users': 100_000,
+    'pickup_points': 500,
+}
+DEFAULT_SCALE = '0.002'
+DEFAULT_TOLERANCE = '0.25'
+# Разница меньше этой (мс) считается шумом
+NOISE_MS = 5.0
+
+
+def get_scale():
+    return float(os.environ.get('BENCH_SCALE', DEFAULT_SCALE))
+
+
+def get_tolerance():
+    return float(os.environ.get('BENCH_TOLERANCE', DEFAULT_TOLERANCE))
+
+
+def volumes(scale=None):
+    """Объём данных для заданного масштаба"""
+    scale = get_scale() if scale is None else scale
+    return {name: max(1, int(count * scale)) for name, count in FULL_VOLUMES.items()}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class Result:
+    """Итоги одного сценария"""
+
+    def __init__(self, name, timings, queries, units):
+        self.name = name
+        self.p50 = percentile(timings, 50) * 1000
+        self.p95 = percentile(timings, 95) * 1000
+        self.mean = sum(timings) / len(timings) * 1000
+        self.throughput = units / sum(timings) if sum(timings) > 0 else 0.0
+        self.queries = max(queries)
+
+    def as_dict(self):
+        return {
+            'p50_ms': round(self.p50, 2),
+            'p95_ms': round(self.p95, 2),
+            'mean_ms': round(self.mean, 2),
+            'throughput': round(self.throughput, 1),
+            'queries': self.queries,
+        }
+
+    def __str__(self):
+        return (f'{self.name:<28} p50 {self.p50:8.1f} мс  p95 {self.p95:8.1f} мс  '
+                f'{self.throughput:10.1f}/с  запросов {self.queries}')
+
+
+def measure(name, func, repeat=30, warmup=3):
+    """
+    Выполнить ``func`` ``repeat`` раз и собрать статистику.
+
+    ``func`` может вернуть число обработанных единиц (например, строк
+    импорта) — по нему считается пропускная способность; иначе единица
+    — один вызов.
+    """
+    for _ in range(warmup):
+        func()
+    timings, queries, units = [], [], 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            done = func()
+            timings.append(time.perf_counter() - started)
+        queries.append(len(captured))
+        units += done or 1
+    return Result(name, timings, queries, units)
+
+
+def baseline_key(scale=None):
+    return f'{connection.vendor}-{get_scale() if scale is None else scale:g}'
+
+
+def load_baseline(key):
+    if not BASELINE_PATH.exists():
+        return {}
+    return json.loads(BASELINE_PATH.read_text()).get(key, {})
+
+
+def save_baseline(key, results):
+    data = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    data[key] = {result.name: result.as_dict() for result in results}
+    BASELINE_PATH.write_text(json.dumps(data, indent=2, ensure_ascii=False, sort_keys=True) + '\n')
+
+
+def report(results, scale=None):
+    """Записать итоги замеров в лог"""
+    scale = get_scale() if scale is None else scale
+    logger.info('масштаб %g: %s', scale, volumes(scale))
+    for result in results:
+        logger.info('%s', result)
+
+
+def compare(results, baseline, tolerance=None):
+    """Список описаний регрессий относительно базовых результатов"""
+    tolerance = get_tolerance() if tolerance is None else tolerance
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if not base:
+            regressions.append(f'{result.name}: нет базовых результатов (запустите с BENCHMARK_UPDATE=1)')
+            continue
+        if result.queries > base['queries']:
+            regressions.append(f'{result.name}: запросов {result.queries} (было {base["queries"]})')
+        # Хвост распределения шумнее медианы, поэтому допуск для p95 вдвое больше
+        for metric, value, allowed in (('p50_ms', result.p50, tolerance), ('p95_ms', result.p95, 2 * tolerance)):
+            limit = base[metric] * (1 + allowed)
+            if value > limit and value - base[metric] > NOISE_MS:
+                regressions.append(f'{result.name}: {metric} {value:.1f} (было {base[metric]})')
+        slower = result.mean - base['mean_ms'] > NOISE_MS
+        if slower and result.throughput < base['throughput'] / (1 + tolerance):
+            regressions.append(
+                f'{result.name}: пропускная способность {result.throughput:.1f}/с (было {base["throughput"]})'
+            )
+    return regressions
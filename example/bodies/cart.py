@@ -0,0 +1,35 @@
+CART_SESSION_KEY = 'cart'
+
+
+class Cart:
+    """Корзина, хранящаяся в сессии как список id товаров"""
+
+    def __init__(self, request):
+        self.session = request.session
+        self.product_ids = list(self.session.get(CART_SESSION_KEY, []))
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def __iter__(self):
+        return iter(self.product_ids)
+
+    def __contains__(self, product_id):
+        return product_id in self.product_ids
+
+    def add(self, product_id):
+        if product_id not in self.product_ids:
+            self.product_ids.append(product_id)
+            self.save()
+
+    def remove(self, product_id):
+        if product_id in self.product_ids:
+            self.product_ids.remove(product_id)
+            self.save()
+
+    def clear(self):
+        self.product_ids = []
+        self.session.pop(CART_SESSION_KEY, None)
+
+    def save(self):
+        self.session[CART_SESSION_KEY] = self.product_ids
@@ -0,0 +1,55 @@
+"""
+Версия каталога для условных запросов (ETag / Last-Modified) к API.
+
+Версия — метка времени в микросекундах, как ``Product.version``. Она
+хранится в единственной строке таблицы ``CatalogVersion`` и повышается в
+той же транзакции, что и изменение товаров: сохранение и удаление
+(bodies.signals), ``update()`` и ``bulk_update()`` (ProductQuerySet, в
+том числе пересчёт миниатюр), импорт, заполнение тестовыми данными. Поэтому все процессы видят одну и ту же версию, откат
+транзакции откатывает и её, а удаление товара меняет ETag так же, как
+изменение.
+
+Ответ 304 на неизменившийся каталог стоит одного чтения этой строки по
+первичному ключу и не читает ни одной строки товаров.
+"""
+
+from datetime import datetime, timezone
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+CATALOG_VERSION_ID = 1
+
+
+def catalog_version():
+    """Текущая версия каталога"""
+    from .models import CatalogVersion
+    return CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).values_list('version', flat=True).first() or 0
+
+
+async def acatalog_version():
+    """Асинхронный вариант catalog_version()"""
+    from .models import CatalogVersion
+    row = await CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).values('version').afirst()
+    return row['version'] if row else 0
+
+
+def bump_catalog_version():
+    """
+    Повысить версию каталога в текущей транзакции.
+
+    Строка версии блокируется до конца транзакции, поэтому параллельные
+    изменения каталога записывают версии по очереди.
+    """
+    from .models import CatalogVersion, Product
+    version = Product.next_version()
+    updated = CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).update(
+        version=Greatest(F('version') + 1, Value(version)),
+    )
+    if not updated:
+        CatalogVersion.objects.get_or_create(pk=CATALOG_VERSION_ID, defaults={'version': version})
+
+
+def version_datetime(version):
+    """Метка версии как дата для Last-Modified"""
+    return datetime.fromtimestamp(version / 1_000_000, tz=timezone.utc)
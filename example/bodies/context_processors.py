@@ -0,0 +1,12 @@
+from .models import Profile
+
+ROLE_LABELS = dict(Profile.ROLE_CHOICES)
+
+
+def role(request):
+    """Роль текущего пользователя для шаблонов (из RoleMiddleware)"""
+    user_role = getattr(request, 'role', 'unauthorized')
+    return {
+        'user_role': user_role,
+        'user_role_display': ROLE_LABELS.get(user_role, user_role),
+    }
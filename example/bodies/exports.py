@@ -0,0 +1,175 @@
+"""
+Выгрузка товаров и заказов в CSV и XLSX.
+
+Строки читаются серверным курсором (``.values().iterator()``) порциями
+по CHUNK_SIZE, без создания объектов модели; артикулы заказов добираются
+одним запросом на порцию. CSV отдаётся потоком, XLSX пишется openpyxl в
+режиме write-only во временный файл — память не растёт с числом строк.
+
+Колонки товаров совпадают с ожидаемыми scripts/import_products.py, поэтому
+выгрузку можно загрузить обратно.
+
+    python manage.py export_shop products -o products.csv
+    python manage.py export_shop orders --since 2026-01-01 -o orders.xlsx
+"""
+
+import csv
+import io
+from datetime import datetime
+from itertools import islice
+
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import Order, Product
+
+CHUNK_SIZE = 2000
+# Сколько символов CSV копить перед отправкой клиенту
+BUFFER_SIZE = 64 * 1024
+
+PRODUCT_HEADER = ['sku', 'name', 'price', 'description']
+ORDER_HEADER = [
+    'id', 'created_at', 'status', 'user', 'pickup_point',
+    'receive_code', 'delivery_date', 'skus',
+]
+ORDER_FIELDS = [
+    'id', 'createdAt', 'status', 'user__username', 'pickupPoint__address',
+    'receiveCode', 'deliveryDate',
+]
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def cell(value):
+    """Значение для CSV/XLSX: даты — местное время без часового пояса (Excel их не понимает)"""
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value)
+    return value
+
+
+# Именно .values(): для values_list() aiterator() в Django 5.x выполняет
+# запрос прямо в цикле событий (SynchronousOnlyOperation)
+def product_queryset():
+    return Product.objects.order_by('id').values(*PRODUCT_HEADER)
+
+
+def order_queryset(since=None, until=None):
+    """Заказы по возрастанию id; ``since``/``until`` — даты создания включительно"""
+    orders = Order.objects.all()
+    if since:
+        orders = orders.filter(createdAt__date__gte=since)
+    if until:
+        orders = orders.filter(createdAt__date__lte=until)
+    return orders.order_by('id').values(*ORDER_FIELDS)
+
+
+def sku_query(order_ids):
+    OrderProduct = Order.products.through
+    return (
+        OrderProduct.objects.filter(order_id__in=order_ids)
+        .order_by('order_id', 'product__sku')
+        .values_list('order_id', 'product__sku')
+    )
+
+
+def order_rows(chunk, links):
+    """Строки порции заказов с артикулами через пробел"""
+    skus = {}
+    for order_id, sku in links:
+        skus.setdefault(order_id, []).append(sku)
+    return [
+        [*(cell(row[name]) for name in ORDER_FIELDS), ' '.join(skus.get(row['id'], ()))]
+        for row in chunk
+    ]
+
+
+def product_table():
+    yield PRODUCT_HEADER
+    for row in product_queryset().iterator(chunk_size=CHUNK_SIZE):
+        yield [row[name] for name in PRODUCT_HEADER]
+
+
+async def aproduct_table():
+    yield PRODUCT_HEADER
+    async for row in product_queryset().aiterator(chunk_size=CHUNK_SIZE):
+        yield [row[name] for name in PRODUCT_HEADER]
+
+
+def order_table(since=None, until=None):
+    yield ORDER_HEADER
+    rows = order_queryset(since, until).iterator(chunk_size=CHUNK_SIZE)
+    while chunk := list(islice(rows, CHUNK_SIZE)):
+        yield from order_rows(chunk, sku_query([row['id'] for row in chunk]))
+
+
+async def aorder_table(since=None, until=None):
+    yield ORDER_HEADER
+    chunk = []
+    async for row in order_queryset(since, until).aiterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            for line in await aorder_rows(chunk):
+                yield line
+            chunk = []
+    for line in await aorder_rows(chunk):
+        yield line
+
+
+async def aorder_rows(chunk):
+    if not chunk:
+        return []
+    return order_rows(chunk, [link async for link in sku_query([row['id'] for row in chunk])])
+
+
+class CsvBuffer:
+    """Копит строки CSV и отдаёт их кусками не меньше BUFFER_SIZE"""
+
+    def __init__(self):
+        # BOM: Excel открывает файл в UTF-8, import_products читает utf-8-sig
+        self.buffer = io.StringIO()
+        self.buffer.write('\ufeff')
+        self.writer = csv.writer(self.buffer)
+
+    def write(self, row):
+        self.writer.writerow([cell(value) for value in row])
+        return self.buffer.tell() >= BUFFER_SIZE
+
+    def take(self):
+        data = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return data
+
+
+def csv_chunks(rows):
+    buffer = CsvBuffer()
+    for row in rows:
+        if buffer.write(row):
+            yield buffer.take()
+    if tail := buffer.take():
+        yield tail
+
+
+async def acsv_chunks(rows):
+    buffer = CsvBuffer()
+    async for row in rows:
+        if buffer.write(row):
+            yield buffer.take()
+    if tail := buffer.take():
+        yield tail
+
+
+def write_xlsx(rows, file, title):
+    """Записать строки в XLSX; write-only книга держит в памяти одну строку"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    for row in rows:
+        sheet.append([cell(value) for value in row])
+    workbook.save(file)
+
+
+def export_filename(name, fmt):
+    return f'{name}-{timezone.localdate():%Y%m%d}.{fmt}'
@@ -0,0 +1,80 @@
+"""
+Уменьшенные копии изображений товаров.
+
+Для каждого изображения строятся миниатюры фиксированной ширины в JPEG
+и WebP. Имя файла содержит хэш содержимого оригинала
+(``thumbs/ab/<хэш>_320.webp``), поэтому одинаковые картинки не
+пересчитываются, а URL миниатюры меняется только вместе с картинкой.
+"""
+
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+THUMBNAIL_DIR = 'thumbs'
+THUMBNAIL_WIDTHS = (320, 640)
+FORMATS = {
+    'webp': ('WEBP', '.webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', '.jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def content_hash(file):
+    """SHA-256 содержимого файла (первые 32 символа)"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(64 * 1024), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()[:32]
+
+
+def variant_name(image_hash, width, fmt):
+    """Путь миниатюры относительно MEDIA_ROOT"""
+    extension = FORMATS[fmt][1]
+    return f'{THUMBNAIL_DIR}/{image_hash[:2]}/{image_hash}_{width}{extension}'
+
+
+def generate_variants(file, image_hash, storage=default_storage):
+    """Создать недостающие миниатюры для открытого файла изображения"""
+    names = {
+        (width, fmt): variant_name(image_hash, width, fmt)
+        for width in THUMBNAIL_WIDTHS for fmt in FORMATS
+    }
+    missing = {key: name for key, name in names.items() if not storage.exists(name)}
+    if not missing:
+        return
+
+    file.seek(0)
+    with Image.open(file) as source:
+        source = ImageOps.exif_transpose(source).convert('RGB')
+        for width in THUMBNAIL_WIDTHS:
+            thumbnail = source.copy()
+            thumbnail.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+            for fmt, (pil_format, _, options) in FORMATS.items():
+                if (width, fmt) not in missing:
+                    continue
+                buffer = BytesIO()
+                thumbnail.save(buffer, pil_format, **options)
+                storage.save(missing[width, fmt], ContentFile(buffer.getvalue()))
+    file.seek(0)
+
+
+def process_image(field_file):
+    """Посчитать хэш изображения и построить миниатюры; вернуть хэш"""
+    field_file.open('rb')
+    try:
+        image_hash = content_hash(field_file)
+        generate_variants(field_file, image_hash, field_file.storage)
+    finally:
+        if field_file._committed:
+            field_file.close()
+    return image_hash
+
+
+def variant_urls(image_hash, fmt, storage=default_storage):
+    """Список (url, ширина) миниатюр одного формата"""
+    return [(storage.url(variant_name(image_hash, width, fmt)), width) for width in THUMBNAIL_WIDTHS]
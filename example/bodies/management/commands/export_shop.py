@@ -0,0 +1,66 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from bodies import exports
+
+
+def date_argument(value):
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+    if date is None:
+        raise ValueError(value)
+    return date
+
+
+class Command(BaseCommand):
+    help = 'Выгрузить товары или заказы в CSV/XLSX (формат по расширению файла)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('table', choices=['products', 'orders'])
+        parser.add_argument('-o', '--output', default='-',
+                            help='Файл .csv или .xlsx; по умолчанию CSV в stdout')
+        parser.add_argument('--since', type=date_argument, metavar='ГГГГ-ММ-ДД',
+                            help='Заказы, созданные не раньше этой даты')
+        parser.add_argument('--until', type=date_argument, metavar='ГГГГ-ММ-ДД',
+                            help='Заказы, созданные не позже этой даты')
+
+    def handle(self, *args, **options):
+        if options['table'] == 'products':
+            if options['since'] or options['until']:
+                raise CommandError('--since/--until относятся только к заказам')
+            rows = exports.product_table()
+        else:
+            rows = exports.order_table(options['since'], options['until'])
+
+        output = options['output']
+        fmt = 'csv' if output == '-' else Path(output).suffix.lower().lstrip('.')
+        if fmt not in exports.FORMATS:
+            raise CommandError('Формат по расширению файла: .csv или .xlsx')
+
+        started = time.monotonic()
+        counted = self.count(rows)
+        if fmt == 'xlsx':
+            exports.write_xlsx(counted, output, options['table'])
+        elif output == '-':
+            self.write_csv(counted, self.stdout)
+        else:
+            with open(output, 'w', encoding='utf-8', newline='') as file:
+                self.write_csv(counted, file)
+        if output != '-':
+            self.stderr.write(f'{self.rows} строк за {time.monotonic() - started:.1f} с -> {output}')
+
+    def count(self, rows):
+        self.rows = -1  # без заголовка
+        for row in rows:
+            self.rows += 1
+            yield row
+
+    @staticmethod
+    def write_csv(rows, file):
+        for chunk in exports.csv_chunks(rows):
+            file.write(chunk)
@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from PIL import Image
+
+from bodies.images import content_hash, generate_variants
+from bodies.models import Product
+from bodies.objectcache import invalidate_products
+
+BATCH_SIZE = 500
+
+
+def build_variants(item):
+    """Рабочий процесс: только файлы и Pillow, без обращений к базе"""
+    pk, name = item
+    try:
+        with default_storage.open(name, 'rb') as file:
+            image_hash = content_hash(file)
+            generate_variants(file, image_hash)
+    except (OSError, Image.DecompressionBombError) as e:
+        return pk, None, str(e)
+    return pk, image_hash, None
+
+
+class Command(BaseCommand):
+    help = 'Построить миниатюры изображений товаров (параллельно на всех ядрах)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Число процессов (по умолчанию — число ядер)')
+        parser.add_argument('--force', action='store_true',
+                            help='Пересчитать и товары, у которых миниатюры уже есть')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            products = products.filter(image_hash='')
+        items = list(products.values_list('pk', 'image'))
+        # Дочерние процессы не должны наследовать открытые соединения с БД
+        connections.close_all()
+
+        done = failed = 0
+        pending = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            for pk, image_hash, error in pool.map(build_variants, items, chunksize=16):
+                if error:
+                    failed += 1
+                    self.stderr.write(f'товар {pk}: {error}')
+                    continue
+                pending.append(Product(pk=pk, image_hash=image_hash, version=Product.next_version()))
+                if len(pending) >= BATCH_SIZE:
+                    done += self.flush(pending)
+        done += self.flush(pending)
+        self.stdout.write(f'готово: {done}, ошибок: {failed}')
+
+    def flush(self, pending):
+        # Новая версия сбрасывает кэш карточек, чтобы они получили srcset
+        # Версию каталога повышает ProductQuerySet.update (через него идёт bulk_update)
+        with transaction.atomic():
+            Product.objects.bulk_update(pending, ['image_hash', 'version'])
+            invalidate_products([product.pk for product in pending])
+        count = len(pending)
+        pending.clear()
+        return count
@@ -0,0 +1,124 @@
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from bodies import seeding
+
+# Сколько строк обрабатывает один рабочий процесс за задачу
+TASK_SIZE = 50_000
+
+GENERATOR_OPTIONS = ('items', 'price', 'user_skew', 'days', 'delivered_share', 'batch_size', 'seed')
+
+_shared = {}
+
+
+def init_worker(shared):
+    """Рабочий процесс: общие параметры и id, без унаследованных соединений с БД"""
+    if not django.apps.apps.ready:
+        django.setup()
+    _shared.update(shared)
+
+
+def run_task(task):
+    kind, start, count = task
+    options = _shared['options']
+    rng = random.Random(options['seed'] * 1_000_003 + start)
+    common = {'batch_size': options['batch_size'], 'use_copy': _shared['use_copy']}
+    if kind == 'products':
+        return kind, seeding.seed_products(count, start, price_range=options['price'], rng=rng, **common)
+    if kind == 'users':
+        return kind, seeding.seed_users(count, start, **common)
+    return kind, seeding.seed_orders(
+        count, _shared['user_ids'], _shared['point_ids'], _shared['product_ids'],
+        items=options['items'], start=start, days=options['days'],
+        delivered_share=options['delivered_share'], user_skew=options['user_skew'],
+        rng=rng, **common,
+    )
+
+
+def split(kind, offset, count):
+    return [(kind, offset + start, min(TASK_SIZE, count - start)) for start in range(0, count, TASK_SIZE)]
+
+
+class Command(BaseCommand):
+    help = 'Заполнить магазин синтетическими данными (товары, пользователи, заказы) для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100_000)
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--orders', type=int, default=200_000)
+        parser.add_argument('--pickup-points', type=int, default=100)
+        parser.add_argument('--items', type=int, nargs=2, default=(1, 5), metavar=('MIN', 'MAX'),
+                            help='Число товаров в заказе')
+        parser.add_argument('--price', type=float, nargs=2, default=(100, 10000), metavar=('MIN', 'MAX'),
+                            help='Диапазон цен товаров, руб.')
+        parser.add_argument('--user-skew', type=float, default=1.0,
+                            help='Неравномерность заказов по пользователям (0 — поровну, 1 — закон Ципфа)')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько последних дней распределить даты заказов')
+        parser.add_argument('--delivered-share', type=float, default=0.8, help='Доля выданных заказов')
+        parser.add_argument('--batch-size', type=int, default=seeding.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Число параллельных процессов (по умолчанию — один)')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Писать через bulk_create даже на PostgreSQL (вместо COPY)')
+        parser.add_argument('--seed', type=int, default=42, help='Начальное значение генератора')
+        parser.add_argument('--offset', type=int, default=0,
+                            help='Начальный номер артикулов и логинов — для дозаписи к уже созданным')
+
+    def handle(self, *args, **options):
+        low, high = options['items']
+        if not 1 <= low <= high:
+            raise CommandError('--items: нужно 1 <= MIN <= MAX')
+        if options['price'][0] > options['price'][1] or options['price'][0] < 0:
+            raise CommandError('--price: нужно 0 <= MIN <= MAX')
+        if options['orders'] and not (options['users'] and options['products'] and options['pickup_points']):
+            raise CommandError('Для заказов нужны товары, пользователи и пункты выдачи')
+
+        use_copy = seeding.can_copy() and not options['no_copy']
+        offset = options['offset']
+        started = time.monotonic()
+        shared = {
+            'options': {name: options[name] for name in GENERATOR_OPTIONS},
+            'use_copy': use_copy,
+            'point_ids': seeding.seed_pickup_points(options['pickup_points'], offset),
+        }
+
+        ids = self.run(
+            split('products', offset, options['products']) + split('users', offset, options['users']),
+            shared, options['workers'],
+        )
+        shared['product_ids'] = ids['products']
+        shared['user_ids'] = ids['users']
+        self.stdout.write(f'товаров: {len(ids["products"])}, пользователей: {len(ids["users"])}, '
+                          f'пунктов выдачи: {len(shared["point_ids"])}')
+
+        # Пункты выдачи каждый раз новые, поэтому коды получения можно нумеровать с нуля
+        orders = self.run(split('orders', 0, options['orders']), shared, options['workers'])
+        self.stdout.write(f'заказов: {orders["orders"]}')
+        self.stdout.write(f'готово за {time.monotonic() - started:.1f} с '
+                          f'({"COPY" if use_copy else "bulk_create"}, процессов: {options["workers"]})')
+
+    def run(self, tasks, shared, workers):
+        """Выполнить задачи в этом процессе или в пуле; собрать результаты по видам"""
+        results = {'products': [], 'users': [], 'orders': 0}
+        if workers <= 1:
+            init_worker(shared)
+            outputs = map(run_task, tasks)
+        else:
+            # Дочерние процессы не должны наследовать открытые соединения с БД
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(shared,))
+            outputs = pool.map(run_task, tasks)
+        try:
+            for kind, value in outputs:
+                results[kind] += value
+                self.stdout.write(f'  {kind}: +{value if isinstance(value, int) else len(value)}')
+        finally:
+            if workers > 1:
+                pool.shutdown()
+        return results
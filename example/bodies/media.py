@@ -0,0 +1,127 @@
+"""
+Раздача загруженных файлов (MEDIA_ROOT) с поддержкой кэширования.
+
+- сильный ETag и Last-Modified, ответы 304 на If-None-Match / If-Modified-Since;
+- запросы Range (одиночный диапазон) с ответом 206;
+- миниатюры (имя содержит хэш содержимого) отдаются с
+  ``Cache-Control: immutable`` на год, остальные файлы — с ревалидацией;
+- полный файл отдаётся через FileResponse, поэтому WSGI-сервер может
+  использовать wsgi.file_wrapper (sendfile). Если задан
+  MEDIA_ACCEL_REDIRECT_PREFIX, отдачу файла берёт на себя nginx
+  (X-Accel-Redirect).
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from .images import THUMBNAIL_DIR
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """Файл, из которого читается только диапазон [start, start + length)"""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.name = file.name
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """Разобрать заголовок Range; вернуть (start, end) включительно, None или False (416)"""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # несколько диапазонов или мусор — отдаём файл целиком
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def cache_headers(path, stat):
+    immutable = path.startswith(f'{THUMBNAIL_DIR}/')
+    max_age = getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)
+    return {
+        'ETag': quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}'),
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': IMMUTABLE_CACHE_CONTROL if immutable else f'public, max-age={max_age}',
+        'Accept-Ranges': 'bytes',
+    }
+
+
+@require_safe
+def serve_media(request, path):
+    """Отдать файл из MEDIA_ROOT"""
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(fullpath)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Файл не найден')
+    if not os.path.isfile(fullpath):
+        raise Http404('Файл не найден')
+
+    headers = cache_headers(path, stat)
+    not_modified = get_conditional_response(
+        request, etag=headers['ETag'], last_modified=int(stat.st_mtime),
+    )
+    if not_modified is not None:
+        for name, value in headers.items():
+            not_modified.headers.setdefault(name, value)
+        return not_modified
+
+    accel_prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '')
+    if accel_prefix:
+        content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+        response = HttpResponse(content_type=content_type, headers=headers)
+        response['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + quote(path)
+        return response
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range == headers['ETag']):
+        byte_range = parse_range(range_header, stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+    file = open(fullpath, 'rb')
+    if byte_range is None:
+        return FileResponse(file, headers=headers)
+    start, end = byte_range
+    response = FileResponse(FileRange(file, start, end - start + 1), status=206, headers=headers)
+    response['Content-Length'] = end - start + 1
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return response
@@ -0,0 +1,300 @@
+"""
+Метрики запросов в памяти процесса в формате Prometheus.
+
+``MetricsMiddleware`` для доли запросов METRICS_SAMPLE_RATE записывает по
+имени маршрута (``resolver_match.view_name``):
+
+- время ответа (гистограмма);
+- число SQL-запросов (гистограмма) и суммарное время в БД;
+- попадания и промахи кэша (через бэкенды ``Metered*Cache``);
+- размер ответа (гистограмма).
+
+Попадания и промахи кэша объектов (bodies.objectcache) считаются для
+всех запросов процесса, без выборки.
+
+Во время запроса счётчики собираются в объект ``RequestStats`` из
+contextvar: обёртка execute_wrapper ставится на каждое соединение один
+раз (сигнал connection_created) и при выключенной выборке только
+проверяет contextvar. При METRICS_SAMPLE_RATE = 0 middleware сразу
+передаёт запрос дальше.
+
+Метрики отдаёт ``/system/metrics/`` (только администратору). Каждый
+процесс хранит свои значения, поэтому Prometheus должен опрашивать
+процессы по отдельности или суммировать их.
+"""
+
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+_current = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Счётчики одного запроса"""
+
+    __slots__ = ('queries', 'db_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Накопленные метрики процесса по представлениям"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = {}      # (view, method, status) -> число
+        self.durations = {}     # view -> Histogram
+        self.queries = {}       # view -> Histogram
+        self.db_time = {}       # view -> секунды
+        self.sizes = {}         # view -> Histogram
+        self.cache = {}         # (view, 'hit'|'miss') -> число
+        self.objects = {}       # (model, 'hit'|'miss') -> число, кэш объектов
+
+    def count_object_lookup(self, model, result):
+        with self.lock:
+            key = (model, result)
+            self.objects[key] = self.objects.get(key, 0) + 1
+
+    def record(self, view, method, status, duration, size, stats):
+        with self.lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self._histogram(self.durations, view, DURATION_BUCKETS).observe(duration)
+            self._histogram(self.queries, view, QUERY_BUCKETS).observe(stats.queries)
+            self.db_time[view] = self.db_time.get(view, 0.0) + stats.db_time
+            if size is not None:
+                self._histogram(self.sizes, view, SIZE_BUCKETS).observe(size)
+            for result, count in (('hit', stats.cache_hits), ('miss', stats.cache_misses)):
+                if count:
+                    self.cache[view, result] = self.cache.get((view, result), 0) + count
+
+    @staticmethod
+    def _histogram(histograms, view, buckets):
+        histogram = histograms.get(view)
+        if histogram is None:
+            histogram = histograms[view] = Histogram(buckets)
+        return histogram
+
+
+registry = Registry()
+
+
+def sample_rate():
+    return getattr(settings, 'METRICS_SAMPLE_RATE', 0.0)
+
+
+def count_queries(execute, sql, params, many, context):
+    """execute_wrapper: время и число запросов текущего запроса из выборки"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time += time.perf_counter() - started
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """connection_created: поставить обёртку на соединение (один раз)"""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def response_size(response):
+    if response.streaming:
+        length = response.get('Content-Length')
+        return int(length) if length else None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """Замеры времени, SQL и кэша по представлениям; ставится первым в MIDDLEWARE"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        rate = sample_rate()
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    def record(self, request, response, started, stats):
+        match = getattr(request, 'resolver_match', None)
+        registry.record(
+            match.view_name if match else 'unmatched',
+            request.method,
+            response.status_code,
+            time.perf_counter() - started,
+            response_size(response),
+            stats,
+        )
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, started, stats)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.record(request, response, started, stats)
+        return response
+
+
+_MISSING = object()
+
+
+class MeteredCacheMixin:
+    """Считает попадания и промахи get() в запросах из выборки"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        stats = _current.get()
+        if value is _MISSING:
+            if stats is not None:
+                stats.cache_misses += 1
+            return default
+        if stats is not None:
+            stats.cache_hits += 1
+        return value
+
+
+class MeteredLocMemCache(MeteredCacheMixin, LocMemCache):
+    # get_many() у LocMemCache сводится к get() и уже посчитан
+    pass
+
+
+class MeteredRedisCache(MeteredCacheMixin, RedisCache):
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        stats = _current.get()
+        if stats is not None:
+            stats.cache_hits += len(found)
+            stats.cache_misses += len(keys) - len(found)
+        return found
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _histogram_lines(name, histograms):
+    lines = []
+    for view, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{_labels(view=view, le=bound)}}} {cumulative}')
+        lines.append(f'{name}_sum{{{_labels(view=view)}}} {histogram.sum:g}')
+        lines.append(f'{name}_count{{{_labels(view=view)}}} {histogram.count}')
+    return lines
+
+
+def render_prometheus(pool_stats=None):
+    """Текст для Prometheus (text exposition format 0.0.4)"""
+    lines = [
+        '# HELP shop_metrics_sample_rate Доля запросов, попадающих в метрики',
+        '# TYPE shop_metrics_sample_rate gauge',
+        f'shop_metrics_sample_rate {sample_rate():g}',
+    ]
+    with registry.lock:
+        lines += ['# HELP shop_requests_total Запросы по представлению, методу и статусу',
+                  '# TYPE shop_requests_total counter']
+        for (view, method, status), count in sorted(registry.requests.items()):
+            lines.append(f'shop_requests_total{{{_labels(view=view, method=method, status=status)}}} {count}')
+
+        lines += ['# HELP shop_request_duration_seconds Время ответа',
+                  '# TYPE shop_request_duration_seconds histogram']
+        lines += _histogram_lines('shop_request_duration_seconds', registry.durations)
+
+        lines += ['# HELP shop_db_queries SQL-запросов на один запрос',
+                  '# TYPE shop_db_queries histogram']
+        lines += _histogram_lines('shop_db_queries', registry.queries)
+
+        lines += ['# HELP shop_db_time_seconds_total Суммарное время SQL-запросов',
+                  '# TYPE shop_db_time_seconds_total counter']
+        for view, seconds in sorted(registry.db_time.items()):
+            lines.append(f'shop_db_time_seconds_total{{{_labels(view=view)}}} {seconds:g}')
+
+        lines += ['# HELP shop_response_bytes Размер ответа',
+                  '# TYPE shop_response_bytes histogram']
+        lines += _histogram_lines('shop_response_bytes', registry.sizes)
+
+        lines += ['# HELP shop_cache_requests_total Обращения к кэшу: hit или miss',
+                  '# TYPE shop_cache_requests_total counter']
+        for (view, result), count in sorted(registry.cache.items()):
+            lines.append(f'shop_cache_requests_total{{{_labels(view=view, result=result)}}} {count}')
+
+        lines += ['# HELP shop_object_cache_requests_total Чтения из кэша объектов: hit или miss',
+                  '# TYPE shop_object_cache_requests_total counter']
+        for (model, result), count in sorted(registry.objects.items()):
+            lines.append(f'shop_object_cache_requests_total{{{_labels(model=model, result=result)}}} {count}')
+
+    if pool_stats:
+        lines += ['# HELP shop_db_pool Пул соединений psycopg_pool',
+                  '# TYPE shop_db_pool gauge']
+        for alias, stats in sorted(pool_stats.items()):
+            for name, value in sorted(stats.items()):
+                lines.append(f'shop_db_pool{{{_labels(alias=alias, stat=name)}}} {value}')
+    return '\n'.join(lines) + '\n'
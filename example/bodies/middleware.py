@@ -0,0 +1,70 @@
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.functional import SimpleLazyObject
+
+from .models import Profile
+
+
+def get_user_role(user):
+    """Получить роль пользователя"""
+    if not user.is_authenticated:
+        return 'unauthorized'
+    try:
+        return user.profile.role
+    except Profile.DoesNotExist:
+        # Профиль создаётся сигналом при регистрации; если его нет,
+        # считаем пользователя авторизированным, но не пишем в базу на чтении
+        return 'authorized'
+
+
+def get_request_role(request):
+    if not hasattr(request, '_cached_role'):
+        request._cached_role = get_user_role(request.user)
+    return request._cached_role
+
+
+async def aget_request_role(request):
+    if not hasattr(request, '_cached_role'):
+        # Загруженный пользователь подставляется в request.user, чтобы
+        # шаблоны async-представлений не читали его синхронно из event loop;
+        # профиль приходит вместе с ним (ProfileModelBackend)
+        request.user = await request.auser()
+        request._cached_role = get_user_role(request.user)
+    return request._cached_role
+
+
+class RoleMiddleware:
+    """
+    Сохраняет роль пользователя в ``request.role``. Должен стоять после
+    AuthenticationMiddleware.
+
+    Роль вычисляется лениво, при первом обращении, и один раз за запрос:
+    запросы, которым она не нужна (статика, медиа, API), не читают ни
+    сессию, ни пользователя. Асинхронный код берёт роль через
+    ``await request.arole()``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        self.set_role(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.set_role(request)
+        return await self.get_response(request)
+
+    @staticmethod
+    def set_role(request):
+        request.role = SimpleLazyObject(partial(get_request_role, request))
+        request.arole = partial(aget_request_role, request)
@@ -0,0 +1,62 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:15
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+from bodies.operations import ConcurrentAddIndex, PostgresRunSQL
+
+
+SEARCH_VECTOR_SQL = """
+    setweight(to_tsvector('russian', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce({row}description, '')), 'B')
+"""
+
+CREATE_TRIGGER_SQL = f"""
+CREATE FUNCTION bodies_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {SEARCH_VECTOR_SQL.format(row='NEW.')};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bodies_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON bodies_product
+    FOR EACH ROW EXECUTE FUNCTION bodies_product_search_vector_update();
+
+UPDATE bodies_product SET search_vector = {SEARCH_VECTOR_SQL.format(row='')};
+"""
+
+DROP_TRIGGER_SQL = """
+DROP TRIGGER IF EXISTS bodies_product_search_vector_trigger ON bodies_product;
+DROP FUNCTION IF EXISTS bodies_product_search_vector_update();
+"""
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+    atomic = False
+
+    dependencies = [
+        ('bodies', '0003_product_image'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        PostgresRunSQL(CREATE_TRIGGER_SQL, DROP_TRIGGER_SQL),
+        ConcurrentAddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+        ),
+        ConcurrentAddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodies', '0004_product_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, editable=False, verbose_name='Версия'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+from bodies.operations import ConcurrentAddIndex
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('bodies', '0005_product_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        ConcurrentAddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-createdAt', '-id'], name='order_user_created_idx'),
+        ),
+    ]
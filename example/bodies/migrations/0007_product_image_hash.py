@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodies', '0006_order_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Хэш изображения'),
+        ),
+    ]
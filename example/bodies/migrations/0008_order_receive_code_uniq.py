@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+import bodies.models
+from bodies.operations import ConcurrentAddUniqueConstraint
+
+
+def regenerate_duplicate_codes(apps, schema_editor):
+    """Выдать новые коды заказам, у которых код совпал в одном пункте выдачи"""
+    Order = apps.get_model('bodies', 'Order')
+    duplicates = (
+        Order.objects.values('pickupPoint', 'receiveCode')
+        .annotate(n=Count('id')).filter(n__gt=1)
+    )
+    for row in duplicates:
+        orders = Order.objects.filter(pickupPoint=row['pickupPoint'], receiveCode=row['receiveCode'])
+        for order in orders.order_by('id')[1:]:
+            while True:
+                code = bodies.models.generate_receive_code()
+                if not Order.objects.filter(pickupPoint=order.pickupPoint_id, receiveCode=code).exists():
+                    break
+            Order.objects.filter(pk=order.pk).update(receiveCode=code)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('bodies', '0007_product_image_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(regenerate_duplicate_codes, migrations.RunPython.noop, atomic=True),
+        ConcurrentAddUniqueConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('pickupPoint', 'receiveCode'), name='order_pickup_receive_code_uniq'),
+        ),
+    ]
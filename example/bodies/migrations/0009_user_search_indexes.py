@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+from bodies.operations import ConcurrentAddIndex, PostgresRunSQL
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('bodies', '0008_order_receive_code_uniq'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        ConcurrentAddIndex(
+            model_name='profile',
+            index=models.Index(fields=['role'], name='profile_role_idx'),
+        ),
+        # Поиск по началу логина без учёта регистра (username__istartswith):
+        # Django строит UPPER(username::text) LIKE UPPER('ab%'), обычный
+        # индекс по username для LIKE не подходит
+        PostgresRunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS auth_user_username_prefix_idx '
+                'ON auth_user (UPPER(username::text) text_pattern_ops)',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS auth_user_username_prefix_idx',
+        ),
+    ]
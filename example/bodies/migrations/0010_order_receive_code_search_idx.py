@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-18 14:40
+
+from django.db import migrations
+
+from bodies.operations import PostgresRunSQL
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('bodies', '0009_user_search_indexes'),
+    ]
+
+    operations = [
+        # Поиск заказа по коду в админке ('=receiveCode'): Django строит
+        # UPPER("receiveCode"::text) = UPPER('...'), а уникальный индекс
+        # (pickupPoint, receiveCode) без пункта выдачи не помогает
+        PostgresRunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS order_receive_code_upper_idx '
+                'ON bodies_order (UPPER("receiveCode"::text))',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS order_receive_code_upper_idx',
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:05
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+from bodies.operations import ConcurrentAddIndex
+
+# Границы на момент миграции (bodies.prices.PRICE_BUCKET_BOUNDS может меняться)
+BOUNDS = [Decimal(bound) for bound in (0, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)]
+
+
+def fill_price_buckets(apps, schema_editor):
+    Product = apps.get_model('bodies', 'Product')
+    PriceBucket = apps.get_model('bodies', 'PriceBucket')
+    ranges = list(zip(BOUNDS, BOUNDS[1:] + [None]))
+    counts = Product.objects.aggregate(**{
+        f'bucket_{i}': Count('id', filter=Q(price__gte=lower, **({'price__lt': upper} if upper else {})))
+        for i, (lower, upper) in enumerate(ranges)
+    })
+    PriceBucket.objects.bulk_create(
+        [PriceBucket(lower=lower, count=counts[f'bucket_{i}']) for i, (lower, _) in enumerate(ranges)]
+    )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('bodies', '0010_order_receive_code_search_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceBucket',
+            fields=[
+                ('lower', models.DecimalField(decimal_places=2, max_digits=10, primary_key=True, serialize=False, verbose_name='Цена от')),
+                ('count', models.IntegerField(default=0, verbose_name='Товаров')),
+            ],
+            options={
+                'verbose_name': 'Диапазон цен',
+                'verbose_name_plural': 'Диапазоны цен',
+                'ordering': ['lower'],
+            },
+        ),
+        ConcurrentAddIndex(
+            model_name='product',
+            index=models.Index(fields=['price'], name='product_price_idx'),
+        ),
+        migrations.RunPython(fill_price_buckets, migrations.RunPython.noop, atomic=True),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+from bodies.operations import ConcurrentAddIndex
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('bodies', '0011_price_buckets'),
+    ]
+
+    operations = [
+        ConcurrentAddIndex(
+            model_name='product',
+            index=models.Index(fields=['version'], name='product_version_idx'),
+        ),
+    ]
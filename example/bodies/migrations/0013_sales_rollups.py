@@ -0,0 +1,98 @@
+# Generated by Django 6.0.1 on 2026-10-18 16:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+BATCH_SIZE = 5000
+
+
+def fill_rollups(apps, schema_editor):
+    """Заполнить новые (пустые) таблицы счётчиков из существующих заказов"""
+    Order = apps.get_model('bodies', 'Order')
+    StatusDailyOrders = apps.get_model('bodies', 'StatusDailyOrders')
+    PickupPointDailyOrders = apps.get_model('bodies', 'PickupPointDailyOrders')
+    ProductDailySales = apps.get_model('bodies', 'ProductDailySales')
+    OrderProduct = Order.products.through
+
+    def refill(model, rows, build):
+        batch = []
+        for row in rows:
+            batch.append(build(row))
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_create(batch)
+                batch = []
+        model.objects.bulk_create(batch)
+
+    orders = Order.objects.annotate(day=TruncDate('createdAt'))
+    links = OrderProduct.objects.annotate(day=TruncDate('order__createdAt'))
+    refill(
+        StatusDailyOrders,
+        orders.values('day', 'status').annotate(n=Count('id')).order_by().iterator(),
+        lambda row: StatusDailyOrders(day=row['day'], status=row['status'], orders=row['n']),
+    )
+    refill(
+        PickupPointDailyOrders,
+        orders.filter(pickupPoint__isnull=False).values('day', 'pickupPoint_id')
+        .annotate(n=Count('id')).order_by().iterator(),
+        lambda row: PickupPointDailyOrders(day=row['day'], pickupPoint_id=row['pickupPoint_id'], orders=row['n']),
+    )
+    refill(
+        ProductDailySales,
+        links.values('day', 'product_id').annotate(n=Count('id')).order_by().iterator(),
+        lambda row: ProductDailySales(day=row['day'], product_id=row['product_id'], orders=row['n']),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodies', '0012_product_version_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatusDailyOrders',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('status', models.CharField(choices=[('new', 'Новый'), ('delivered', 'Завершен')], max_length=20, verbose_name='Статус заказа')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+            ],
+            options={
+                'verbose_name': 'Заказы за день по статусу',
+                'verbose_name_plural': 'Заказы за день по статусам',
+                'constraints': [models.UniqueConstraint(fields=('day', 'status'), name='status_daily_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PickupPointDailyOrders',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('pickupPoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bodies.pickuppoint', verbose_name='Пункт выдачи')),
+            ],
+            options={
+                'verbose_name': 'Заказы за день по пункту выдачи',
+                'verbose_name_plural': 'Заказы за день по пунктам выдачи',
+                'constraints': [models.UniqueConstraint(fields=('day', 'pickupPoint'), name='pickup_point_daily_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('orders', models.IntegerField(default=0, verbose_name='Заказов')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bodies.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Продажи товара за день',
+                'verbose_name_plural': 'Продажи товаров за день',
+                'constraints': [models.UniqueConstraint(fields=('day', 'product'), name='product_daily_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
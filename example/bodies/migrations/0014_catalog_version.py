@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 17:20
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def create_catalog_version(apps, schema_editor):
+    Product = apps.get_model('bodies', 'Product')
+    CatalogVersion = apps.get_model('bodies', 'CatalogVersion')
+    version = Product.objects.aggregate(Max('version'))['version__max'] or 0
+    CatalogVersion.objects.create(pk=1, version=version)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bodies', '0013_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+            ],
+            options={
+                'verbose_name': 'Версия каталога',
+                'verbose_name_plural': 'Версия каталога',
+            },
+        ),
+        migrations.RunPython(create_catalog_version, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_version_idx',
+        ),
+    ]
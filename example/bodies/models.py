@@ -1,7 +1,16 @@
 import random
 import string
-from django.db import models
+import time
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from django.contrib.auth.models import User
+from PIL import Image
+
+from .images import process_image
 
 
 def generate_receive_code():
@@ -9,6 +18,37 @@ def generate_receive_code():
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 
 
+class ProductQuerySet(models.QuerySet):
+    """
+    Массовые изменения товаров повышают их версию (ключ кэша карточек) и
+    версию каталога (ETag API, bodies.catalog) и убирают их из кэша объектов
+    (bodies.objectcache)
+    """
+
+    def update(self, **kwargs):
+        # bulk_update() тоже выполняется через update() — по пачкам pk__in
+        from .catalog import bump_catalog_version
+        from .objectcache import invalidate_all_products
+        if 'version' not in kwargs:
+            kwargs['version'] = Greatest(F('version') + 1, Value(Product.next_version()))
+        with transaction.atomic(using=self.db):
+            count = super().update(**kwargs)
+            if count:
+                bump_catalog_version()
+        # Изменённые id неизвестны без лишнего SELECT: сбрасываются все товары
+        if count:
+            invalidate_all_products()
+        return count
+    update.alters_data = True
+
+
+class ProductManager(models.Manager.from_queryset(ProductQuerySet)):
+    """Менеджер товаров: поисковый вектор не нужен в Python и не загружается"""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
 class Product(models.Model):
     """Модель товара в магазине"""
     name        = models.CharField(max_length=255, verbose_name="Название товара")
@@ -16,20 +56,111 @@ class Product(models.Model):
     description = models.TextField(blank=True, verbose_name="Описание товара")
     sku         = models.CharField(max_length=50, unique=True, verbose_name="Артикул")
     image       = models.ImageField(upload_to='products/', blank=True, null=True, verbose_name="Изображение товара")
+    # Хэш содержимого изображения; по нему строятся имена миниатюр (bodies.images)
+    image_hash  = models.CharField(max_length=32, blank=True, editable=False, verbose_name="Хэш изображения")
+    # Заполняется триггером PostgreSQL из name (вес A) и description (вес B)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Метка времени последнего изменения (мкс); входит в ключи кэша карточек
+    version     = models.PositiveBigIntegerField(default=0, editable=False, verbose_name="Версия")
+
+    objects = ProductManager()
 
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
         ordering = ['-id']
+        indexes = [
+            # Фильтр каталога по цене (price_min / price_max)
+            models.Index(fields=['price'], name='product_price_idx'),
+            GinIndex(fields=['search_vector'], name='product_search_vector_idx'),
+            GinIndex(fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.sku})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Цена при загрузке: по ней сигналы меняют счётчики диапазонов цен
+        instance._loaded_price = dict(zip(field_names, values)).get('price')
+        return instance
+
+    @staticmethod
+    def next_version(previous=0):
+        """Новая версия: текущее время в мкс, но строго больше предыдущей"""
+        return max(time.time_ns() // 1000, previous + 1)
+
+    def save(self, *args, **kwargs):
+        """Каждое сохранение увеличивает версию товара"""
+        self.version = self.next_version(self.version)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {*update_fields, 'version'}
+            if 'image' in update_fields:
+                update_fields.add('image_hash')
+            kwargs['update_fields'] = update_fields
+        if update_fields is None or 'image' in update_fields:
+            self._refresh_image_hash()
+        super().save(*args, **kwargs)
+
+    def _refresh_image_hash(self):
+        """Построить миниатюры для нового (ещё не сохранённого) изображения"""
+        if not self.image:
+            self.image_hash = ''
+        elif not self.image._committed or not self.image_hash:
+            try:
+                self.image_hash = process_image(self.image)
+            except (OSError, Image.DecompressionBombError):
+                # Не удалось прочитать картинку: показываем оригинал
+                self.image_hash = ''
+
+
+class PriceBucket(models.Model):
+    """Число товаров с ценой от ``lower`` до следующей границы (bodies.prices)"""
+    lower = models.DecimalField(max_digits=10, decimal_places=2, primary_key=True, verbose_name="Цена от")
+    count = models.IntegerField(default=0, verbose_name="Товаров")
+
+    class Meta:
+        verbose_name = "Диапазон цен"
+        verbose_name_plural = "Диапазоны цен"
+        ordering = ['lower']
+
+    def __str__(self):
+        return f"от {self.lower} руб.: {self.count}"
+
+
+class CatalogVersion(models.Model):
+    """Версия каталога для ETag API (bodies.catalog); в таблице одна строка"""
+    version = models.PositiveBigIntegerField(default=0, verbose_name="Версия")
+
+    class Meta:
+        verbose_name = "Версия каталога"
+        verbose_name_plural = "Версия каталога"
+
+    def __str__(self):
+        return str(self.version)
+
+
+class PickupPointQuerySet(models.QuerySet):
+    """Массовые изменения пунктов выдачи сбрасывают их список в кэше (bodies.objectcache)"""
+
+    def update(self, **kwargs):
+        # bulk_update() тоже выполняется через update(); сигналов нет ни у одного
+        from .objectcache import invalidate_pickup_points
+        count = super().update(**kwargs)
+        if count:
+            invalidate_pickup_points()
+        return count
+    update.alters_data = True
+
 
 class PickupPoint(models.Model):
     """Пункт выдачи заказов"""
     address = models.CharField(max_length=500, verbose_name="Адрес пункта выдачи")
 
+    objects = PickupPointQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Пункт выдачи"
         verbose_name_plural = "Пункты выдачи"
@@ -38,6 +169,35 @@ class PickupPoint(models.Model):
         return self.address
 
 
+class OrderQuerySet(models.QuerySet):
+    # Сколько заказов выдавать одним UPDATE
+    DELIVER_BATCH_SIZE = 1000
+
+    def mark_delivered(self):
+        """
+        Отметить новые заказы выданными (UPDATE на пачку); вернуть число заказов.
+
+        Заказы блокируются до UPDATE, чтобы счётчики отчётов (bodies.reports)
+        перенесли из «новых» в «выданные» ровно те заказы, что изменились.
+        """
+        from .reports import RollupDelta
+        now = timezone.now()
+        delivered = 0
+        with transaction.atomic():
+            orders = self.filter(status='new').select_for_update().values_list('id', 'createdAt')
+            rows = list(orders.order_by('id'))
+            for start in range(0, len(rows), self.DELIVER_BATCH_SIZE):
+                batch = rows[start:start + self.DELIVER_BATCH_SIZE]
+                delivered += self.model.objects.filter(
+                    id__in=[order_id for order_id, _ in batch], status='new',
+                ).update(status='delivered', deliveryDate=now)
+            delta = RollupDelta()
+            for _, created_at in rows:
+                delta.change_status(created_at, 'new', 'delivered')
+            delta.apply()
+        return delivered
+
+
 class Order(models.Model):
     """Заказ пользователя"""
     STATUS_CHOICES = [
@@ -53,15 +213,65 @@ class Order(models.Model):
     pickupPoint  = models.ForeignKey(PickupPoint, on_delete=models.SET_NULL, null=True, verbose_name="Пункт выдачи")
     status       = models.CharField(max_length=20, choices=STATUS_CHOICES, default='new', verbose_name="Статус заказа")
 
+    objects = OrderQuerySet.as_manager()
+
+    # Сколько раз пробовать новый код при совпадении в пункте выдачи
+    RECEIVE_CODE_ATTEMPTS = 5
+
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
         ordering = ['-createdAt']
+        indexes = [
+            # История заказов пользователя: WHERE user_id = ... ORDER BY createdAt DESC, id DESC
+            models.Index(fields=['user', '-createdAt', '-id'], name='order_user_created_idx'),
+        ]
+        constraints = [
+            # Поиск заказа на пункте выдачи по коду — один проход по индексу
+            models.UniqueConstraint(fields=['pickupPoint', 'receiveCode'], name='order_pickup_receive_code_uniq'),
+        ]
 
     def __str__(self):
         user_name = self.user.get_full_name() or self.user.username
         return f"Заказ #{self.id} - {user_name}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Поля при загрузке: по ним сигналы переносят заказ в счётчиках отчётов
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
     
+    def save(self, *args, **kwargs):
+        """При совпадении кода получения в пункте выдачи генерируется новый код"""
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        for attempt in range(self.RECEIVE_CODE_ATTEMPTS):
+            try:
+                with transaction.atomic():
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if attempt == self.RECEIVE_CODE_ATTEMPTS - 1 or not self._receive_code_taken():
+                    raise
+                self.receiveCode = generate_receive_code()
+
+    def _receive_code_taken(self):
+        return Order.objects.filter(pickupPoint_id=self.pickupPoint_id, receiveCode=self.receiveCode).exists()
+
+    @classmethod
+    def place(cls, user, pickup_point, products):
+        """Создать заказ с товарами в одной транзакции (2 INSERT)"""
+        with transaction.atomic():
+            order = cls.objects.create(user=user, pickupPoint=pickup_point)
+            OrderProduct = cls.products.through
+            OrderProduct.objects.bulk_create([
+                OrderProduct(order_id=order.id, product_id=product.id) for product in products
+            ])
+            # bulk_create не вызывает m2m_changed: счётчики товаров в отчётах — здесь
+            from .reports import RollupDelta
+            RollupDelta().add_products(order.createdAt, [product.id for product in products]).apply()
+        return order
+
     def get_skus(self):
         """Получить артикулы всех товаров в заказе"""
         return ', '.join([p.sku for p in self.products.all()])
@@ -82,9 +292,33 @@ class Profile(models.Model):
     class Meta:
         verbose_name = "Профиль"
         verbose_name_plural = "Профили"
+        indexes = [
+            # Фильтр по роли на странице пользователей
+            models.Index(fields=['role'], name='profile_role_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} ({self.get_role_display()})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {f.attname: getattr(self, f.attname) for f in self._meta.concrete_fields}
+
+    def has_changes(self):
+        """Отличается ли профиль от загруженного из базы (новый — всегда)"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        return any(
+            getattr(self, f.attname) != loaded[f.attname]
+            for f in self._meta.concrete_fields if f.attname in loaded
+        )
     
     def is_admin(self):
         return self.role == 'admin'
@@ -94,3 +328,54 @@ class Profile(models.Model):
     
     def is_authorized(self):
         return self.role in ['authorized', 'editor', 'admin']
+
+
+class StatusDailyOrders(models.Model):
+    """Число заказов, созданных за день, по текущему статусу (bodies.reports)"""
+    day    = models.DateField(verbose_name="День")
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, verbose_name="Статус заказа")
+    orders = models.IntegerField(default=0, verbose_name="Заказов")
+
+    class Meta:
+        verbose_name = "Заказы за день по статусу"
+        verbose_name_plural = "Заказы за день по статусам"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='status_daily_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.get_status_display()}: {self.orders}"
+
+
+class PickupPointDailyOrders(models.Model):
+    """Число заказов за день в пункт выдачи (bodies.reports)"""
+    day         = models.DateField(verbose_name="День")
+    pickupPoint = models.ForeignKey(PickupPoint, on_delete=models.CASCADE, verbose_name="Пункт выдачи")
+    orders      = models.IntegerField(default=0, verbose_name="Заказов")
+
+    class Meta:
+        verbose_name = "Заказы за день по пункту выдачи"
+        verbose_name_plural = "Заказы за день по пунктам выдачи"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'pickupPoint'], name='pickup_point_daily_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.pickupPoint_id}: {self.orders}"
+
+
+class ProductDailySales(models.Model):
+    """Число заказов за день с товаром (bodies.reports)"""
+    day     = models.DateField(verbose_name="День")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Товар")
+    orders  = models.IntegerField(default=0, verbose_name="Заказов")
+
+    class Meta:
+        verbose_name = "Продажи товара за день"
+        verbose_name_plural = "Продажи товаров за день"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='product_daily_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.product_id}: {self.orders}"
@@ -0,0 +1,142 @@
+"""
+Кэш объектов: товары по id и артикулу, пункты выдачи.
+
+Чтение идёт через кэш (read-through): при промахе объект читается из
+основной базы (не с реплики, чтобы не положить в кэш отстающую версию) и
+кладётся в кэш на OBJECT_CACHE_TIMEOUT секунд. Отсутствующие объекты не
+кэшируются, поэтому новый товар виден сразу.
+
+- товар хранится под ключом по id; ключ по артикулу хранит только id
+  (если артикул товара с этим id уже другой, это промах и чтение из базы);
+- пункты выдачи — маленькая таблица: все пункты хранятся одним списком,
+  поиск по id идёт по нему.
+
+Кэш только для чтения: объекты из него не сохраняются и не удаляются.
+Изменения делаются над строкой, заново прочитанной из основной базы
+(``select_for_update()``), иначе устаревшая копия затёрла бы чужие правки.
+
+Ключи удаляются при сохранении и удалении (bodies.signals), импорте,
+пересчёте миниатюр и заполнении тестовыми данными — сразу и ещё раз после
+фиксации транзакции, чтобы параллельный запрос не вернул в кэш старую
+версию. ``Product.objects.update()`` и ``bulk_update()`` (ProductQuerySet)
+не знают изменённых id без лишнего SELECT, поэтому сбрасывают все товары
+разом: товар хранится вместе с поколением кэша, и новое поколение делает
+все прежние записи промахами. С кэшем в памяти процесса (LocMemCache) другие процессы видят
+изменения не позже чем через OBJECT_CACHE_TIMEOUT; с Redis — сразу.
+
+Попадания и промахи считаются в bodies.metrics (``shop_object_cache_requests_total``).
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router, transaction
+from django.http import Http404
+
+from .metrics import registry
+
+PRODUCT_KEY = 'obj:product:{}'
+PRODUCT_SKU_KEY = 'obj:product:sku:{}'
+PRODUCT_GENERATION_KEY = 'obj:product:generation'
+PICKUP_POINTS_KEY = 'obj:pickup-points'
+
+
+def _timeout():
+    return getattr(settings, 'OBJECT_CACHE_TIMEOUT', 300)
+
+
+def _sku_key(sku):
+    # Артикул может содержать пробелы и любые символы — в ключ идёт хэш
+    return PRODUCT_SKU_KEY.format(hashlib.md5(sku.encode()).hexdigest())
+
+
+def _count(model, hit):
+    registry.count_object_lookup(model, 'hit' if hit else 'miss')
+
+
+def _delete(keys):
+    """Удалить ключи сейчас и после фиксации транзакции"""
+    keys = list(keys)
+    if not keys:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_product(pk=None, sku=None):
+    """Товар по id или по артикулу; None, если нет"""
+    if pk is None:
+        pk = cache.get(_sku_key(sku))
+    keys = [PRODUCT_GENERATION_KEY] + ([PRODUCT_KEY.format(pk)] if pk is not None else [])
+    found = cache.get_many(keys)
+    generation = found.get(PRODUCT_GENERATION_KEY)
+    cached_generation, product = found.get(keys[-1], (None, None)) if pk is not None else (None, None)
+    if (product is not None and generation is not None and cached_generation == generation
+            and (sku is None or product.sku == sku)):
+        _count('product', True)
+        return product
+    _count('product', False)
+    from .models import Product
+    products = Product.objects.using(router.db_for_write(Product))
+    product = products.filter(**({'pk': pk} if sku is None else {'sku': sku})).first()
+    if product is not None:
+        if generation is None and not cache.add(PRODUCT_GENERATION_KEY, generation := time.time_ns(), None):
+            generation = cache.get(PRODUCT_GENERATION_KEY)
+        cache.set_many({
+            PRODUCT_KEY.format(product.pk): (generation, product),
+            _sku_key(product.sku): product.pk,
+        }, _timeout())
+    return product
+
+
+def get_product_or_404(pk=None, sku=None):
+    product = get_product(pk, sku)
+    if product is None:
+        raise Http404('Товар не найден')
+    return product
+
+
+def invalidate_products(ids=(), skus=()):
+    """Убрать товары из кэша (после изменений в обход save())"""
+    _delete([PRODUCT_KEY.format(pk) for pk in ids] + [_sku_key(sku) for sku in skus])
+
+
+def invalidate_all_products():
+    """Сбросить все товары: новое поколение сейчас и после фиксации транзакции"""
+    def bump():
+        cache.set(PRODUCT_GENERATION_KEY, time.time_ns(), None)
+    bump()
+    transaction.on_commit(bump)
+
+
+def pickup_points():
+    """Все пункты выдачи (список из кэша)"""
+    from .models import PickupPoint
+    points = cache.get(PICKUP_POINTS_KEY)
+    _count('pickuppoint', points is not None)
+    if points is None:
+        points = list(PickupPoint.objects.using(router.db_for_write(PickupPoint)).order_by('id'))
+        cache.set(PICKUP_POINTS_KEY, points, _timeout())
+    return points
+
+
+def get_pickup_point(pk):
+    """Пункт выдачи по id; None, если нет"""
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return None
+    return next((point for point in pickup_points() if point.pk == pk), None)
+
+
+def get_pickup_point_or_404(pk):
+    point = get_pickup_point(pk)
+    if point is None:
+        raise Http404('Пункт выдачи не найден')
+    return point
+
+
+def invalidate_pickup_points():
+    _delete([PICKUP_POINTS_KEY])
@@ -0,0 +1,65 @@
+"""
+Операции миграций, которые работают и на PostgreSQL, и на других СУБД.
+
+На PostgreSQL индексы строятся через CREATE INDEX CONCURRENTLY (без
+блокировки записи в таблицу), на остальных базах — обычным CREATE INDEX.
+Индексы, специфичные для PostgreSQL (GIN и т.п.), на других базах пропускаются.
+"""
+
+from django.contrib.postgres.indexes import PostgresIndex
+from django.contrib.postgres.operations import AddIndexConcurrently, NotInTransactionMixin
+from django.db.migrations.operations import AddConstraint, AddIndex, RunSQL
+
+
+class ConcurrentAddIndex(AddIndexConcurrently):
+    """AddIndexConcurrently с запасным вариантом для не-PostgreSQL баз"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        elif not isinstance(self.index, PostgresIndex):
+            AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        elif not isinstance(self.index, PostgresIndex):
+            AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class PostgresRunSQL(RunSQL):
+    """RunSQL, который выполняется только на PostgreSQL"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class ConcurrentAddUniqueConstraint(NotInTransactionMixin, AddConstraint):
+    """
+    Уникальное ограничение по полям без долгой блокировки таблицы.
+
+    На PostgreSQL сначала строится уникальный индекс CONCURRENTLY, затем он
+    превращается в ограничение (ADD CONSTRAINT ... USING INDEX). На других
+    базах — обычный AddConstraint.
+    """
+
+    atomic = False
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(app_label, schema_editor, from_state, to_state)
+        self._ensure_not_in_transaction(schema_editor)
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return
+        quote = schema_editor.quote_name
+        table = quote(model._meta.db_table)
+        name = quote(self.constraint.name)
+        columns = ', '.join(quote(model._meta.get_field(field).column) for field in self.constraint.fields)
+        schema_editor.execute(f'CREATE UNIQUE INDEX CONCURRENTLY {name} ON {table} ({columns})')
+        schema_editor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}')
@@ -0,0 +1,167 @@
+"""
+Курсорная (keyset) пагинация.
+
+Вместо OFFSET страница выбирается условием по ключу сортировки
+(например, ``id < курсор``), поэтому страница N стоит столько же,
+сколько первая: база идёт по индексу сразу с нужного места.
+"""
+
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+
+
+def get_per_page(request, default=None, maximum=None):
+    """Размер страницы из параметра ``per_page`` с ограничением сверху"""
+    default = default or getattr(settings, 'PAGE_SIZE', 24)
+    maximum = maximum or getattr(settings, 'MAX_PAGE_SIZE', 100)
+    try:
+        per_page = int(request.GET.get('per_page', default))
+    except (TypeError, ValueError):
+        per_page = default
+    return max(1, min(per_page, maximum))
+
+
+def encode_cursor(values):
+    """Упаковать значения ключа сортировки в непрозрачную строку для URL"""
+    raw = json.dumps([str(v) for v in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Распаковать курсор; при ошибке вернуть None"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+        return None
+    return values
+
+
+class KeysetPage:
+    """Страница результатов с курсорами на соседние страницы"""
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None, per_page=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Пагинатор по набору полей сортировки, например ``('-id',)``.
+
+    Последнее поле должно быть уникальным (обычно ``id``), чтобы порядок
+    был строгим и записи не терялись на границе страниц.
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.keys = [(f.lstrip('-'), f.startswith('-')) for f in self.ordering]
+
+    def _to_python(self, name, value):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            field = annotation.output_field
+        else:
+            field = self.queryset.model._meta.get_field(name)
+        return field.to_python(value)
+
+    def _parse(self, cursor):
+        values = decode_cursor(cursor) if cursor else None
+        if values is None or len(values) != len(self.keys):
+            return None
+        try:
+            return [self._to_python(name, v) for (name, _), v in zip(self.keys, values)]
+        except Exception:
+            return None
+
+    def _cursor_for(self, obj):
+        return encode_cursor(getattr(obj, name) for name, _ in self.keys)
+
+    def _seek(self, values, forward):
+        """Условие «строго после курсора» (или «строго до» при forward=False)"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.keys, values):
+            op = 'lt' if descending == forward else 'gt'
+            condition |= equal & Q(**{f'{name}__{op}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def _reversed_ordering(self):
+        return [name if descending else f'-{name}' for name, descending in self.keys]
+
+    def _prepare(self, after=None, before=None):
+        """Запрос для страницы и направление обхода"""
+        before_values = self._parse(before)
+        if before_values is not None:
+            qs = self.queryset.filter(self._seek(before_values, forward=False))
+            return qs.order_by(*self._reversed_ordering())[:self.per_page + 1], False, True
+
+        after_values = self._parse(after)
+        qs = self.queryset
+        if after_values is not None:
+            qs = qs.filter(self._seek(after_values, forward=True))
+        return qs.order_by(*self.ordering)[:self.per_page + 1], True, after_values is not None
+
+    def _finish(self, rows, forward, has_other_side):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        if not rows:
+            return KeysetPage([], per_page=self.per_page)
+
+        next_cursor = prev_cursor = None
+        if (has_more if forward else has_other_side):
+            next_cursor = self._cursor_for(rows[-1])
+        if (has_other_side if forward else has_more):
+            prev_cursor = self._cursor_for(rows[0])
+        return KeysetPage(rows, next_cursor, prev_cursor, self.per_page)
+
+    def forward_queryset(self, after=None):
+        """
+        Запрос строк страницы после курсора ``after`` плюс одна лишняя —
+        признак следующей страницы. Для потоковой выдачи (``.iterator()``).
+        """
+        qs, _, _ = self._prepare(after)
+        return qs
+
+    def cursor_for_row(self, row):
+        """Курсор по словарю значений (строке из ``.values()``)"""
+        return encode_cursor(row[name] for name, _ in self.keys)
+
+    def page(self, after=None, before=None):
+        """Получить страницу после курсора ``after`` или перед курсором ``before``"""
+        qs, forward, has_other_side = self._prepare(after, before)
+        return self._finish(list(qs), forward, has_other_side)
+
+    async def apage(self, after=None, before=None):
+        """Асинхронный вариант page()"""
+        qs, forward, has_other_side = self._prepare(after, before)
+        return self._finish([obj async for obj in qs], forward, has_other_side)
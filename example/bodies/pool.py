@@ -0,0 +1,21 @@
+"""
+Статистика пулов соединений с базой.
+
+При DB_POOL (config.settings) у соединений PostgreSQL есть пул psycopg_pool;
+его счётчики отдают эндпоинт /system/db-pool/ и метрики Prometheus
+(bodies.metrics). Базы без пула (SQLite, PostgreSQL без DB_POOL) пропускаются.
+"""
+
+from django.db import connections
+
+
+def get_pool_stats():
+    """Статистика пулов соединений psycopg_pool по всем базам"""
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            pool_stats = pool.get_stats()
+            pool_stats['in_use'] = pool_stats['pool_size'] - pool_stats['pool_available']
+            stats[alias] = pool_stats
+    return stats
@@ -0,0 +1,119 @@
+"""
+Цены товаров: разбор фильтра и гистограмма по диапазонам цен.
+
+Число товаров в каждом диапазоне хранится в таблице ``PriceBucket`` и
+меняется инкрементально (``count = count + delta``) при сохранении и
+удалении товара (bodies.signals) и при импорте. Каталог читает готовые
+счётчики одним запросом к маленькой таблице вместо агрегации по товарам.
+Полный пересчёт — ``rebuild_price_buckets()`` (после массовых изменений
+в обход модели, например ``Product.objects.update(price=...)``).
+"""
+
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Value, When
+
+# Нижние границы диапазонов, руб.; последний диапазон не ограничен сверху
+PRICE_BUCKET_BOUNDS = [
+    Decimal(bound) for bound in
+    (0, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+]
+
+CENT = Decimal('0.01')
+MAX_PRICE = Decimal('99999999.99')  # DecimalField(max_digits=10, decimal_places=2)
+
+
+def parse_price(value):
+    """Цена из параметра запроса как Decimal с копейками; None, если не число"""
+    try:
+        price = Decimal(value.strip().replace(',', '.'))
+    except (InvalidOperation, AttributeError):
+        return None
+    if not price.is_finite():
+        return None
+    return min(max(price, Decimal(0)), MAX_PRICE).quantize(CENT)
+
+
+def bucket_for(price):
+    """Нижняя граница диапазона, в который попадает цена"""
+    return PRICE_BUCKET_BOUNDS[max(bisect_right(PRICE_BUCKET_BOUNDS, price) - 1, 0)]
+
+
+def apply_deltas(deltas, bucket_model=None):
+    """
+    Изменить счётчики диапазонов одним UPDATE.
+
+    ``deltas`` — {нижняя граница: изменение числа товаров}.
+    """
+    if bucket_model is None:
+        from .models import PriceBucket as bucket_model
+    deltas = {lower: delta for lower, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    bucket_model.objects.filter(lower__in=deltas).update(count=F('count') + Case(
+        *[When(lower=lower, then=Value(delta)) for lower, delta in deltas.items()],
+        default=Value(0),
+    ))
+
+
+def as_decimal(price):
+    """Цена как Decimal: поле модели до сохранения может хранить строку или число"""
+    return price if isinstance(price, Decimal) else Decimal(str(price))
+
+
+def price_change_deltas(old_prices, new_prices):
+    """Изменения счётчиков при замене цен old_prices на new_prices (None — товара нет)"""
+    deltas = Counter()
+    for old, new in zip(old_prices, new_prices):
+        if old is not None:
+            deltas[bucket_for(as_decimal(old))] -= 1
+        if new is not None:
+            deltas[bucket_for(as_decimal(new))] += 1
+    return deltas
+
+
+def rebuild_price_buckets():
+    """Пересчитать все диапазоны одним проходом по товарам"""
+    from .models import PriceBucket as bucket_model, Product as product_model
+    ranges = list(zip(PRICE_BUCKET_BOUNDS, PRICE_BUCKET_BOUNDS[1:] + [None]))
+    with transaction.atomic():
+        counts = product_model.objects.aggregate(**{
+            f'bucket_{i}': Count('id', filter=Q(price__gte=lower, **({'price__lt': upper} if upper else {})))
+            for i, (lower, upper) in enumerate(ranges)
+        })
+        bucket_model.objects.exclude(lower__in=PRICE_BUCKET_BOUNDS).delete()
+        bucket_model.objects.bulk_create(
+            [bucket_model(lower=lower, count=counts[f'bucket_{i}']) for i, (lower, _) in enumerate(ranges)],
+            update_conflicts=True,
+            unique_fields=['lower'],
+            update_fields=['count'],
+        )
+
+
+def price_range_label(lower, upper):
+    """Подпись диапазона цен [lower, upper); upper=None — без верхней границы"""
+    if upper is None:
+        label = f'от {lower:,.0f} ₽'
+    elif lower == 0:
+        label = f'до {upper:,.0f} ₽'
+    else:
+        label = f'{lower:,.0f} – {upper:,.0f} ₽'
+    return label.replace(',', ' ')
+
+
+def price_facets(buckets):
+    """Диапазоны для показа рядом с фильтром: границы фильтра, подпись, число товаров"""
+    buckets = sorted(buckets, key=lambda bucket: bucket.lower)
+    facets = []
+    for bucket, following in zip(buckets, buckets[1:] + [None]):
+        upper = following.lower if following is not None else None
+        facets.append({
+            'label': price_range_label(bucket.lower, upper),
+            'price_min': bucket.lower if bucket.lower else '',
+            'price_max': upper - CENT if upper is not None else '',
+            'count': bucket.count,
+        })
+    return facets
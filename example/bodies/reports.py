@@ -0,0 +1,198 @@
+"""
+Отчёты по продажам из накопительных таблиц (rollup).
+
+Три таблицы счётчиков по дням (день — дата создания заказа в TIME_ZONE):
+
+- ``StatusDailyOrders`` — заказы за день по текущему статусу;
+- ``PickupPointDailyOrders`` — заказы за день по пунктам выдачи;
+- ``ProductDailySales`` — сколько заказов за день содержали товар.
+
+Счётчики меняются инкрементально (``orders = orders + delta``), в той же
+транзакции, что и заказы: при создании заказа (Order.place, сигналы
+bodies.signals), смене статуса (OrderQuerySet.mark_delivered, сохранение
+заказа), изменении состава и удалении заказа, при заполнении тестовыми
+данными. Страница отчётов читает только эти таблицы, а не заказы.
+
+Полный пересчёт за период — ``rebuild_rollups()`` или команда
+``python manage.py rebuild_reports [--since ДАТА] [--until ДАТА]``
+(после изменений в обход модели, например ``Order.objects.update(...)``).
+"""
+
+from collections import Counter
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+# Строк счётчиков в одном INSERT ... ON CONFLICT
+UPSERT_BATCH_SIZE = 500
+REBUILD_BATCH_SIZE = 5000
+
+
+def order_day(created_at):
+    """День заказа для отчётов: дата создания в часовом поясе сайта"""
+    if timezone.is_aware(created_at):
+        return timezone.localdate(created_at)
+    return created_at.date()
+
+
+def increment(model, keys, deltas):
+    """
+    Прибавить ``deltas`` ({(значения keys): изменение}) к счётчикам ``orders``.
+
+    Один INSERT ... ON CONFLICT DO UPDATE на пачку (PostgreSQL и SQLite):
+    отсутствующие строки создаются, существующие увеличиваются. Ключи
+    сортируются, чтобы параллельные транзакции блокировали строки в одном
+    порядке и не попадали во взаимную блокировку.
+    """
+    deltas = sorted((key, delta) for key, delta in deltas.items() if delta)
+    if not deltas:
+        return
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in keys]
+    table = quote(model._meta.db_table)
+    columns = ', '.join(quote(field.column) for field in fields)
+    counter = quote(model._meta.get_field('orders').column)
+    row = '(' + ', '.join(['%s'] * (len(fields) + 1)) + ')'
+    with connection.cursor() as cursor:
+        for start in range(0, len(deltas), UPSERT_BATCH_SIZE):
+            batch = deltas[start:start + UPSERT_BATCH_SIZE]
+            params = []
+            for key, delta in batch:
+                params += [field.get_db_prep_save(value, connection) for field, value in zip(fields, key)]
+                params.append(delta)
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}, {counter}) VALUES {", ".join([row] * len(batch))} '
+                f'ON CONFLICT ({columns}) DO UPDATE SET {counter} = {table}.{counter} + EXCLUDED.{counter}',
+                params,
+            )
+
+
+class RollupDelta:
+    """Изменения счётчиков отчётов, записываемые одним apply()"""
+
+    def __init__(self):
+        self.statuses = Counter()
+        self.pickup_points = Counter()
+        self.products = Counter()
+
+    def add_order(self, created_at, status, pickup_point_id, sign=1):
+        day = order_day(created_at)
+        self.statuses[day, status] += sign
+        if pickup_point_id is not None:
+            self.pickup_points[day, pickup_point_id] += sign
+        return self
+
+    def remove_order(self, created_at, status, pickup_point_id):
+        return self.add_order(created_at, status, pickup_point_id, sign=-1)
+
+    def change_status(self, created_at, old, new):
+        day = order_day(created_at)
+        self.statuses[day, old] -= 1
+        self.statuses[day, new] += 1
+        return self
+
+    def add_products(self, created_at, product_ids, sign=1):
+        day = order_day(created_at)
+        for product_id in product_ids:
+            self.products[day, product_id] += sign
+        return self
+
+    def remove_products(self, created_at, product_ids):
+        return self.add_products(created_at, product_ids, sign=-1)
+
+    def apply(self):
+        from .models import PickupPointDailyOrders, ProductDailySales, StatusDailyOrders
+        increment(StatusDailyOrders, ('day', 'status'), self.statuses)
+        increment(PickupPointDailyOrders, ('day', 'pickupPoint'), self.pickup_points)
+        increment(ProductDailySales, ('day', 'product'), self.products)
+
+
+def _created_between(queryset, prefix, since, until):
+    if since:
+        queryset = queryset.filter(**{f'{prefix}createdAt__date__gte': since})
+    if until:
+        queryset = queryset.filter(**{f'{prefix}createdAt__date__lte': until})
+    return queryset
+
+
+def _refill(model, rows, build):
+    batch = []
+    for row in rows:
+        batch.append(build(row))
+        if len(batch) == REBUILD_BATCH_SIZE:
+            model.objects.bulk_create(batch)
+            batch = []
+    model.objects.bulk_create(batch)
+
+
+def rebuild_rollups(since=None, until=None):
+    """
+    Пересчитать счётчики за дни с ``since`` по ``until`` (включительно;
+    None — без ограничения) из таблиц заказов: по одному GROUP BY на таблицу.
+    """
+    from .models import Order, PickupPointDailyOrders, ProductDailySales, StatusDailyOrders
+    OrderProduct = Order.products.through
+
+    def day_range(queryset):
+        if since:
+            queryset = queryset.filter(day__gte=since)
+        if until:
+            queryset = queryset.filter(day__lte=until)
+        return queryset
+
+    orders = _created_between(Order.objects.all(), '', since, until).annotate(day=TruncDate('createdAt'))
+    links = _created_between(OrderProduct.objects.all(), 'order__', since, until).annotate(
+        day=TruncDate('order__createdAt'),
+    )
+    with transaction.atomic():
+        for model in (StatusDailyOrders, PickupPointDailyOrders, ProductDailySales):
+            day_range(model.objects.all()).delete()
+        _refill(
+            StatusDailyOrders,
+            orders.values('day', 'status').annotate(n=Count('id')).order_by().iterator(),
+            lambda row: StatusDailyOrders(day=row['day'], status=row['status'], orders=row['n']),
+        )
+        _refill(
+            PickupPointDailyOrders,
+            orders.filter(pickupPoint__isnull=False).values('day', 'pickupPoint_id')
+            .annotate(n=Count('id')).order_by().iterator(),
+            lambda row: PickupPointDailyOrders(day=row['day'], pickupPoint_id=row['pickupPoint_id'], orders=row['n']),
+        )
+        _refill(
+            ProductDailySales,
+            links.values('day', 'product_id').annotate(n=Count('id')).order_by().iterator(),
+            lambda row: ProductDailySales(day=row['day'], product_id=row['product_id'], orders=row['n']),
+        )
+
+
+def daily_orders(since, until):
+    """Заказы по дням: [(день, {статус: число}, всего)], новые дни сверху"""
+    from .models import StatusDailyOrders
+    days = {}
+    rows = StatusDailyOrders.objects.filter(day__gte=since, day__lte=until, orders__gt=0)
+    for day, status, orders in rows.values_list('day', 'status', 'orders'):
+        days.setdefault(day, {})[status] = orders
+    return [(day, counts, sum(counts.values())) for day, counts in sorted(days.items(), reverse=True)]
+
+
+def top_pickup_points(since, until, limit=20):
+    from .models import PickupPointDailyOrders
+    return list(
+        PickupPointDailyOrders.objects.filter(day__gte=since, day__lte=until)
+        .values('pickupPoint_id', 'pickupPoint__address')
+        .annotate(total=Sum('orders')).filter(total__gt=0)
+        .order_by('-total', 'pickupPoint_id')[:limit]
+    )
+
+
+def top_products(since, until, limit=20):
+    from .models import ProductDailySales
+    return list(
+        ProductDailySales.objects.filter(day__gte=since, day__lte=until)
+        .values('product_id', 'product__sku', 'product__name')
+        .annotate(total=Sum('orders')).filter(total__gt=0)
+        .order_by('-total', 'product_id')[:limit]
+    )
@@ -0,0 +1,124 @@
+"""
+Маршрутизация запросов между основной базой и репликами.
+
+Записи и по умолчанию все чтения идут в ``default``. На реплики из
+DATABASE_REPLICAS уходят только чтения страниц-списков, помеченных
+``@replica_reads`` (каталог, история заказов, список пользователей): им
+не страшно небольшое отставание. Даже там чтения остаются на основной базе:
+
+- внутри транзакции (чтобы видеть только что записанные данные);
+- в запросах, которые изменяют данные (POST и т.п.);
+- в течение REPLICA_PIN_SECONDS после такого запроса для того же клиента
+  (cookie), чтобы пользователь сразу видел свои изменения, даже если
+  реплика отстаёт.
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PIN_COOKIE = 'pin_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_pinned = ContextVar('pin_to_primary', default=False)
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def pin_to_primary():
+    """Все чтения внутри блока — из основной базы"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def read_from_replica():
+    """Чтения внутри блока можно отдать реплике"""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads(view_func):
+    """Декоратор представления-списка: его чтения идут на реплики"""
+    if iscoroutinefunction(view_func):
+        async def wrapper(request, *args, **kwargs):
+            with read_from_replica():
+                return await view_func(request, *args, **kwargs)
+    else:
+        def wrapper(request, *args, **kwargs):
+            with read_from_replica():
+                return view_func(request, *args, **kwargs)
+    return wraps(view_func)(wrapper)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if (not replicas or not _replica_reads.get() or _pinned.get()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики — потоковые реплики PostgreSQL: схема и данные приходят
+        # с основной базы, мигрировать их нельзя
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaPinMiddleware:
+    """
+    Закрепляет запрос за основной базой, если он изменяет данные или если
+    клиент недавно что-то записал (cookie с ограниченным сроком жизни).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def should_pin(self, request):
+        return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+    def remember_write(self, request, response):
+        if request.method not in SAFE_METHODS:
+            seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+            response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.should_pin(request):
+            return self.get_response(request)
+        with pin_to_primary():
+            response = self.get_response(request)
+        return self.remember_write(request, response)
+
+    async def __acall__(self, request):
+        if not self.should_pin(request):
+            return await self.get_response(request)
+        with pin_to_primary():
+            response = await self.get_response(request)
+        return self.remember_write(request, response)
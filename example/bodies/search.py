@@ -0,0 +1,61 @@
+"""
+Поиск товаров.
+
+На PostgreSQL используется полнотекстовый поиск по ``Product.search_vector``
+(GIN-индекс) плюс триграммное сходство по названию (GIN gin_trgm_ops) для
+устойчивости к опечаткам. Результаты ранжируются по релевантности.
+На других СУБД — простой поиск по вхождению подстроки.
+"""
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.functions import Cast
+
+from .prices import parse_price
+
+SEARCH_CONFIG = 'russian'
+
+# Ранг хранится целым числом, чтобы по нему можно было строить курсор пагинации
+RANK_SCALE = 1_000_000
+
+
+def search_products(queryset, query):
+    """
+    Отфильтровать товары по поисковой строке и добавить аннотацию ``rank``.
+
+    Результат нужно сортировать по ``('-rank', '-id')``.
+    """
+    query = query.strip()
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        ).annotate(rank=Value(0, output_field=IntegerField()))
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    relevance = SearchRank(F('search_vector'), search_query) + TrigramWordSimilarity(query, 'name')
+    return queryset.filter(
+        Q(search_vector=search_query) | Q(name__trigram_word_similar=query)
+    ).annotate(rank=Cast(relevance * RANK_SCALE, IntegerField()))
+
+
+def filter_catalog(queryset, params):
+    """
+    Фильтры каталога из параметров запроса: ``search``, ``price_min``, ``price_max``.
+
+    Вернуть (queryset, порядок для KeysetPaginator).
+    """
+    ordering = ('-id',)
+    search = params.get('search', '').strip()
+    if search:
+        # Результаты поиска упорядочены по релевантности
+        queryset = search_products(queryset, search)
+        ordering = ('-rank', '-id')
+    # Точное сравнение Decimal с DecimalField (индекс product_price_idx)
+    price_min = parse_price(params.get('price_min', ''))
+    price_max = parse_price(params.get('price_max', ''))
+    if price_min is not None:
+        queryset = queryset.filter(price__gte=price_min)
+    if price_max is not None:
+        queryset = queryset.filter(price__lte=price_max)
+    return queryset, ordering
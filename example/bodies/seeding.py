@@ -0,0 +1,215 @@
+"""
+Заполнение базы синтетическими данными для нагрузочных тестов.
+
+Все строки создаются пачками: через bulk_create (один INSERT на пачку)
+или, на PostgreSQL с ``use_copy=True``, через COPY FROM STDIN. Для COPY
+id заранее берутся из последовательности таблицы, чтобы сразу связать
+заказы с товарами. Пароль хэшируется один раз на всех пользователей.
+Коды получения заказов строятся из порядкового номера, поэтому не
+совпадают и не требуют повторных попыток.
+"""
+
+import random
+import string
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .catalog import bump_catalog_version
+from .models import Order, PickupPoint, Product, Profile
+from .objectcache import invalidate_pickup_points
+from .prices import apply_deltas, price_change_deltas
+from .reports import RollupDelta
+
+BATCH_SIZE = 5000
+PASSWORD = 'bench'
+CODE_ALPHABET = string.digits + string.ascii_uppercase
+
+WORDS = [
+    'чайник', 'кружка', 'лампа', 'стул', 'стол', 'полка', 'ковёр', 'подушка',
+    'зеркало', 'часы', 'рюкзак', 'зонт', 'плед', 'ваза', 'корзина', 'фонарь',
+]
+ADJECTIVES = [
+    'красный', 'синий', 'большой', 'маленький', 'деревянный', 'стальной',
+    'складной', 'лёгкий', 'прочный', 'классический', 'новый', 'удобный',
+]
+
+
+def batched(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def receive_code(number):
+    """Уникальный 6-значный код получения по порядковому номеру"""
+    code = ''
+    for _ in range(6):
+        number, digit = divmod(number, len(CODE_ALPHABET))
+        code = CODE_ALPHABET[digit] + code
+    return code
+
+
+def can_copy():
+    return connection.vendor == 'postgresql'
+
+
+def allocate_ids(model, count):
+    """Взять ``count`` значений из последовательности id таблицы"""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [table, model._meta.pk.column, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def copy_objects(model, objects, with_pk=True):
+    """Записать объекты одним COPY (без сигналов и pre_save, как bulk_create)"""
+    fields = [f for f in model._meta.concrete_fields if with_pk or not f.primary_key]
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(f.column) for f in fields)
+    with connection.cursor() as cursor:
+        with cursor.copy(f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN') as copy:
+            for obj in objects:
+                copy.write_row([f.get_db_prep_save(f.value_from_object(obj), connection) for f in fields])
+
+
+def insert(model, objects, use_copy=False):
+    """Записать пачку объектов; вернуть их с заполненными id"""
+    if not use_copy:
+        return model.objects.bulk_create(objects)
+    for obj, pk in zip(objects, allocate_ids(model, len(objects))):
+        obj.pk = pk
+    copy_objects(model, objects)
+    return objects
+
+
+def insert_links(through, objects, use_copy=False):
+    """Записать строки связи многие-ко-многим (их id не нужны)"""
+    if use_copy:
+        copy_objects(through, objects, with_pk=False)
+    else:
+        through.objects.bulk_create(objects)
+
+
+def make_products(count, start=0, price_range=(100, 10000), rng=random):
+    low, high = price_range
+    for i in range(start, start + count):
+        name = f'{rng.choice(ADJECTIVES)} {rng.choice(WORDS)} {i}'.capitalize()
+        yield Product(
+            name=name,
+            sku=f'SEED-{i:08d}',
+            price=Decimal(rng.randint(int(low * 100), int(high * 100))) / 100,
+            description=f'{name}: {rng.choice(ADJECTIVES)} и {rng.choice(ADJECTIVES)}',
+            version=Product.next_version(),
+        )
+
+
+def seed_products(count, start=0, price_range=(100, 10000), batch_size=BATCH_SIZE,
+                  use_copy=False, rng=random):
+    """Создать товары; вернуть их id"""
+    ids = []
+    for batch in batched(make_products(count, start, price_range, rng), batch_size):
+        with transaction.atomic():
+            ids.extend(product.id for product in insert(Product, batch, use_copy))
+            apply_deltas(price_change_deltas([None] * len(batch), [product.price for product in batch]))
+            bump_catalog_version()
+    return ids
+
+
+def seed_pickup_points(count, start=0):
+    """Создать пункты выдачи; вернуть их id"""
+    points = PickupPoint.objects.bulk_create(
+        PickupPoint(address=f'ул. Тестовая, {i + 1}') for i in range(start, start + count)
+    )
+    invalidate_pickup_points()
+    return [point.id for point in points]
+
+
+def seed_users(count, start=0, role='authorized', batch_size=BATCH_SIZE, use_copy=False):
+    """Создать пользователей с профилями; вернуть их id"""
+    password = make_password(PASSWORD)
+    joined = timezone.now()
+    ids = []
+    for batch in batched(range(start, start + count), batch_size):
+        with transaction.atomic():
+            users = insert(User, [
+                User(username=f'seed{i:07d}', password=password, date_joined=joined) for i in batch
+            ], use_copy)
+            insert(Profile, [Profile(user_id=user.id, role=role) for user in users], use_copy)
+        ids.extend(user.id for user in users)
+    return ids
+
+
+def user_weights(user_ids, skew):
+    """
+    Накопленные веса выбора пользователя для заказа.
+
+    При ``skew=0`` заказы распределены равномерно, при ``skew>0`` — по
+    закону Ципфа: k-й пользователь делает заказы в k^skew раз реже первого.
+    """
+    if not skew:
+        return None
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, len(user_ids) + 1)))
+
+
+def seed_orders(count, user_ids, point_ids, product_ids, items=(1, 5), start=0, days=0,
+                delivered_share=0.0, user_skew=0.0, batch_size=BATCH_SIZE, use_copy=False,
+                rng=random):
+    """
+    Создать заказы случайных пользователей со случайными товарами.
+
+    ``items`` — минимальное и максимальное число товаров в заказе,
+    ``days`` — за сколько последних дней распределить даты заказов,
+    ``delivered_share`` — доля выданных заказов.
+    """
+    OrderProduct = Order.products.through
+    cum_weights = user_weights(user_ids, user_skew)
+    now = timezone.now()
+    created = 0
+    for batch in batched(range(start, start + count), batch_size):
+        buyers = rng.choices(user_ids, cum_weights=cum_weights, k=len(batch))
+        orders = []
+        for i, user_id in zip(batch, buyers):
+            created_at = now - timedelta(seconds=rng.uniform(0, days * 86400))
+            delivered = rng.random() < delivered_share
+            orders.append(Order(
+                user_id=user_id,
+                pickupPoint_id=rng.choice(point_ids),
+                receiveCode=receive_code(i),
+                createdAt=created_at,
+                status='delivered' if delivered else 'new',
+                deliveryDate=created_at + timedelta(days=rng.uniform(1, 3)) if delivered else None,
+            ))
+        dates = [order.createdAt for order in orders]
+        with transaction.atomic():
+            orders = insert(Order, orders, use_copy)
+            if days and not use_copy:
+                # bulk_create заменяет createdAt текущим временем (auto_now_add)
+                for order, created_at in zip(orders, dates):
+                    order.createdAt = created_at
+                Order.objects.bulk_update(orders, ['createdAt'])
+            links = [
+                OrderProduct(order_id=order.id, product_id=product_id)
+                for order in orders
+                for product_id in rng.sample(product_ids, min(rng.randint(*items), len(product_ids)))
+            ]
+            insert_links(OrderProduct, links, use_copy)
+            # Вставка пачкой не вызывает сигналы: счётчики отчётов — здесь
+            delta = RollupDelta()
+            created_at = {}
+            for order, date in zip(orders, dates):
+                delta.add_order(date, order.status, order.pickupPoint_id)
+                created_at[order.id] = date
+            for link in links:
+                delta.add_products(created_at[link.order_id], [link.product_id])
+            delta.apply()
+        created += len(orders)
+    return created
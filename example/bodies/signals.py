@@ -1,18 +1,181 @@
-from django.db.models.signals import post_save
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User, update_last_login
+from django.contrib.auth.signals import user_logged_in
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from django.contrib.auth.models import User
-from .models import Profile
+from django.utils import timezone
+from .catalog import bump_catalog_version
+from .models import Order, PickupPoint, Product, Profile
+from .objectcache import invalidate_pickup_points, invalidate_products
+from .prices import apply_deltas, price_change_deltas, rebuild_price_buckets
+from .reports import RollupDelta, order_day, rebuild_rollups
 
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
     """Автоматически создавать профиль при создании пользователя"""
-    if created:
-        Profile.objects.get_or_create(user=instance, defaults={'role': 'authorized'})
+    if created and not raw:
+        Profile.objects.create(user=instance, role='authorized')
 
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    """Сохранять профиль при сохранении пользователя"""
-    if hasattr(instance, 'profile'):
+    """
+    Сохранить профиль вместе с пользователем, только если он уже загружен
+    и изменён: обычное сохранение пользователя не читает и не пишет профиль
+    """
+    if sender.profile.is_cached(instance) and instance.profile.has_changes():
         instance.profile.save()
+
+
+# Вместо django.contrib.auth.models.update_last_login: last_login
+# обновляется не чаще раза в LAST_LOGIN_UPDATE_INTERVAL секунд, одним
+# UPDATE без сигналов post_save (None — не обновлять вовсе)
+user_logged_in.disconnect(update_last_login, dispatch_uid='update_last_login')
+
+
+@receiver(user_logged_in, dispatch_uid='bodies_update_last_login')
+def update_last_login_throttled(sender, user, **kwargs):
+    interval = getattr(settings, 'LAST_LOGIN_UPDATE_INTERVAL', 0)
+    if interval is None:
+        return
+    now = timezone.now()
+    if user.last_login and now - user.last_login < timedelta(seconds=interval):
+        return
+    user.last_login = now
+    type(user)._default_manager.filter(pk=user.pk).update(last_login=now)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def bump_catalog_on_change(sender, instance, raw=False, **kwargs):
+    """Новая версия каталога для ETag API (bodies.catalog)"""
+    if not raw:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def drop_cached_product(sender, instance, **kwargs):
+    """Убрать товар из кэша объектов (bodies.objectcache)"""
+    invalidate_products([instance.pk])
+
+
+@receiver(post_save, sender=PickupPoint)
+@receiver(post_delete, sender=PickupPoint)
+def drop_cached_pickup_points(sender, **kwargs):
+    invalidate_pickup_points()
+
+
+@receiver(post_delete, sender=Product)
+def drop_product_card_cache(sender, instance, **kwargs):
+    """Удалить закэшированные карточки удалённого товара для всех ролей"""
+    cache.delete_many([
+        make_template_fragment_key('product_card', [instance.id, instance.version, role])
+        for role, _ in Profile.ROLE_CHOICES
+    ])
+
+
+@receiver(post_save, sender=Product)
+def count_saved_product_price(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Перенести товар в счётчик диапазона новой цены"""
+    if raw or (update_fields is not None and 'price' not in update_fields):
+        return
+    if not created and getattr(instance, '_loaded_price', None) is None:
+        # Прежняя цена неизвестна (товар не загружался из базы или цена отложена)
+        rebuild_price_buckets()
+    else:
+        apply_deltas(price_change_deltas([None if created else instance._loaded_price], [instance.price]))
+    instance._loaded_price = instance.price
+
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product_price(sender, instance, **kwargs):
+    """Убрать удалённый товар из счётчика диапазона цен"""
+    price = instance.__dict__.get('price')
+    if price is None:
+        rebuild_price_buckets()
+    else:
+        apply_deltas(price_change_deltas([price], [None]))
+
+
+# Счётчики отчётов (bodies.reports). Order.place и mark_delivered пишут
+# связи и статусы в обход сигналов и меняют счётчики сами.
+
+ROLLUP_FIELDS = ('status', 'pickupPoint_id', 'createdAt')
+
+
+@receiver(post_save, sender=Order)
+def count_saved_order(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    """Учесть новый заказ или перенести изменённый в счётчиках статуса и пункта выдачи"""
+    if raw or (update_fields is not None and not {'status', 'pickupPoint'} & set(update_fields)):
+        return
+    current = {name: getattr(instance, name) for name in ROLLUP_FIELDS}
+    loaded = getattr(instance, '_loaded_values', None)
+    if created:
+        RollupDelta().add_order(instance.createdAt, instance.status, instance.pickupPoint_id).apply()
+    elif loaded is None or any(name not in loaded for name in ROLLUP_FIELDS):
+        # Прежние значения неизвестны: пересчитать день заказа
+        day = order_day(instance.createdAt)
+        rebuild_rollups(day, day)
+    elif any(loaded[name] != current[name] for name in ROLLUP_FIELDS):
+        (RollupDelta()
+         .remove_order(loaded['createdAt'], loaded['status'], loaded['pickupPoint_id'])
+         .add_order(instance.createdAt, instance.status, instance.pickupPoint_id)
+         .apply())
+    instance._loaded_values = current
+
+
+@receiver(pre_delete, sender=Order)
+def remember_deleted_order(sender, instance, **kwargs):
+    """
+    Запомнить заказ, как он записан в базе (объект в памяти мог устареть,
+    например после mark_delivered), и его товары: после удаления связей уже не будет
+    """
+    instance._rollup_deleted = (
+        Order.objects.filter(pk=instance.pk).values(*ROLLUP_FIELDS).first(),
+        list(Order.products.through.objects.filter(order_id=instance.pk).values_list('product_id', flat=True)),
+    )
+
+
+@receiver(post_delete, sender=Order)
+def count_deleted_order(sender, instance, **kwargs):
+    """Убрать удалённый заказ из всех счётчиков"""
+    row, product_ids = instance.__dict__.pop('_rollup_deleted', (None, []))
+    if row is None:
+        return
+    (RollupDelta()
+     .remove_order(row['createdAt'], row['status'], row['pickupPoint_id'])
+     .remove_products(row['createdAt'], product_ids)
+     .apply())
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def count_order_products(sender, instance, action, reverse, pk_set, **kwargs):
+    """Изменить счётчики товаров при изменении состава заказа (форма админки, .add/.remove)"""
+    own, other = ('product_id', 'order_id') if reverse else ('order_id', 'product_id')
+    if action in ('pre_remove', 'pre_clear'):
+        # Какие связи действительно удаляются (для post_clear pk_set не передаётся)
+        links = sender.objects.filter(**{own: instance.pk})
+        if action == 'pre_remove':
+            links = links.filter(**{f'{other}__in': pk_set})
+        instance._rollup_removed = list(links.values_list(other, flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    ids = pk_set if action == 'post_add' else instance.__dict__.pop('_rollup_removed', [])
+    if not ids:
+        return
+    sign = 1 if action == 'post_add' else -1
+    delta = RollupDelta()
+    if reverse:
+        # instance — товар, ids — заказы
+        for created_at in Order.objects.filter(pk__in=ids).values_list('createdAt', flat=True):
+            delta.add_products(created_at, [instance.pk], sign)
+    else:
+        delta.add_products(instance.createdAt, ids, sign)
+    delta.apply()
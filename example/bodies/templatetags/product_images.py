@@ -0,0 +1,23 @@
+from django import template
+
+from ..images import variant_urls
+
+register = template.Library()
+
+
+@register.inclusion_tag('product_picture.html')
+def product_picture(product, sizes='(max-width: 600px) 100vw, 320px'):
+    """Изображение товара с миниатюрами WebP/JPEG через srcset"""
+    if not product.image_hash:
+        return {'product': product, 'src': product.image.url, 'sources': None}
+
+    def srcset(fmt):
+        return ', '.join(f'{url} {width}w' for url, width in variant_urls(product.image_hash, fmt))
+
+    jpeg = variant_urls(product.image_hash, 'jpeg')
+    return {
+        'product': product,
+        'src': jpeg[0][0],
+        'sources': {'webp': srcset('webp'), 'jpeg': srcset('jpeg')},
+        'sizes': sizes,
+    }
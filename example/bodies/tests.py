@@ -1,3 +1,1389 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipIf, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections
+from django.http import Http404, HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import benchmarks, metrics, objectcache, seeding
+from .catalog import bump_catalog_version, catalog_version
+from .images import THUMBNAIL_WIDTHS, content_hash, variant_name
+from .media import serve_media
+from .models import (
+    Order, PickupPoint, PickupPointDailyOrders, PriceBucket, Product, ProductDailySales, Profile,
+    StatusDailyOrders,
+)
+from .pagination import KeysetPaginator
+from .pool import get_pool_stats
+from .prices import price_change_deltas, rebuild_price_buckets
+from .reports import rebuild_rollups
+from .routers import (
+    PIN_COOKIE, PrimaryReplicaRouter, ReplicaPinMiddleware, pin_to_primary, read_from_replica, replica_reads,
+)
+from .search import filter_catalog
+
+
+class OrderListTests(TestCase):
+    """История заказов: постоянное число запросов и курсорная пагинация"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='buyer')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.products = [
+            Product.objects.create(name=f'Товар {i}', price=100 + i, sku=f'SKU-{i}')
+            for i in range(3)
+        ]
+
+    def create_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(user=self.user, pickupPoint=self.point)
+            order.products.add(*self.products)
+
+    def test_query_count_does_not_depend_on_orders(self):
+        self.client.force_login(self.user)
+        url = reverse('order_list') + '?per_page=50'
+
+        self.create_orders(2)
+        # сессия, пользователь с профилем, заказы с пунктом выдачи, товары
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['orders']), 2)
+
+        self.create_orders(30)
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['orders']), 32)
+        self.assertContains(response, 'SKU-0')
+        self.assertContains(response, self.point.address)
+
+    def test_pagination_walks_all_orders(self):
+        self.create_orders(5)
+        self.client.force_login(self.user)
+        url = reverse('order_list')
+
+        seen = []
+        response = self.client.get(url, {'per_page': 2})
+        while True:
+            page = response.context['page']
+            seen.extend(order.id for order in page)
+            if not page.has_next:
+                break
+            response = self.client.get(url, {'per_page': 2, 'after': page.next_cursor})
+
+        expected = list(Order.objects.filter(user=self.user).values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRouterTests(SimpleTestCase):
+    """Чтения списков — с реплики, остальные и после записи — с основной базы"""
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_only_listing_reads_go_to_replica(self):
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+        with read_from_replica():
+            self.assertEqual(self.router.db_for_read(Product), 'replica_1')
+        self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_1', 'bodies'))
+
+    def test_pinned_reads_go_to_primary(self):
+        with read_from_replica():
+            with pin_to_primary():
+                self.assertEqual(self.router.db_for_read(Product), 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'replica_1')
+
+    def test_async_listing_view(self):
+        @replica_reads
+        async def view(request):
+            return self.router.db_for_read(Product)
+
+        self.assertEqual(async_to_sync(view)(None), 'replica_1')
+        self.assertEqual(self.router.db_for_read(Product), 'default')
+
+    def test_write_request_pins_client(self):
+        seen = []
+
+        @replica_reads
+        def view(request):
+            seen.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        middleware = ReplicaPinMiddleware(view)
+        factory = RequestFactory()
+
+        response = middleware(factory.post('/'))
+        self.assertIn(PIN_COOKIE, response.cookies)
+        middleware(factory.get('/'))
+        factory.cookies[PIN_COOKIE] = '1'
+        middleware(factory.get('/'))
+        self.assertEqual(seen, ['default', 'replica_1', 'default'])
+
+
+@skipUnless(os.environ.get('BENCHMARK') == '1', 'замеры запускаются с BENCHMARK=1')
+class BenchmarkTests(TestCase):
+    """Время ответа и число запросов на реалистичном объёме данных (см. bodies/benchmarks.py)"""
+
+    IMPORT_ROWS = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.volumes = benchmarks.volumes()
+        rng = random.Random(42)
+        cls.product_ids = seeding.seed_products(cls.volumes['products'], rng=rng)
+        cls.point_ids = seeding.seed_pickup_points(cls.volumes['pickup_points'])
+        user_ids = seeding.seed_users(cls.volumes['users'])
+        seeding.seed_orders(cls.volumes['orders'], user_ids, cls.point_ids, cls.product_ids, rng=rng)
+        cls.buyer = User.objects.get(pk=user_ids[0])
+        cls.admin = User.objects.create_user('bench-admin', password='bench')
+        cls.admin.profile.role = 'admin'
+        cls.admin.profile.save()
+
+    def get(self, url):
+        def request():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+        return request
+
+    def buy(self):
+        product_id = random.choice(self.product_ids)
+        url = reverse('create_order', args=[product_id, self.point_ids[0]])
+        self.assertEqual(self.client.post(url).status_code, 302)
+
+    def import_files(self, directory, count):
+        """CSV-файлы с новыми артикулами для каждого запуска импорта"""
+        files = []
+        for number in range(count):
+            path = Path(directory) / f'import_{number}.csv'
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['name', 'sku', 'price', 'description'])
+                for i in range(self.IMPORT_ROWS):
+                    writer.writerow([f'Импорт {number}-{i}', f'IMP-{number}-{i}', 100 + i % 900, 'Из файла'])
+            files.append(path)
+        return iter(files)
+
+    def test_no_regressions(self):
+        from scripts.import_products import import_file
+
+        results = [
+            benchmarks.measure('product_list_anonymous', self.get(reverse('product_list'))),
+        ]
+        self.client.force_login(self.buyer)
+        results += [
+            benchmarks.measure('product_list', self.get(reverse('product_list'))),
+            benchmarks.measure('product_list_search', self.get(reverse('product_list') + '?search=чайник')),
+            benchmarks.measure('product_list_price', self.get(reverse('product_list') + '?price_min=500&price_max=2000')),
+            benchmarks.measure('order_list', self.get(reverse('order_list'))),
+            benchmarks.measure('create_order', self.buy),
+        ]
+        self.client.force_login(self.admin)
+        results.append(benchmarks.measure('manage_users', self.get(reverse('manage_users')), repeat=10, warmup=1))
+
+        with tempfile.TemporaryDirectory() as directory:
+            files = self.import_files(directory, 11)
+            results.append(benchmarks.measure(
+                'import_products', lambda: import_file(next(files)).processed, repeat=10, warmup=1,
+            ))
+
+        benchmarks.report(results)
+
+        key = benchmarks.baseline_key()
+        if os.environ.get('BENCHMARK_UPDATE') == '1':
+            benchmarks.save_baseline(key, results)
+            return
+        baseline = benchmarks.load_baseline(key)
+        if not baseline:
+            self.fail(f'нет базовых результатов для {key} в {benchmarks.BASELINE_PATH.name}: '
+                      'запустите с BENCHMARK_UPDATE=1')
+        regressions = benchmarks.compare(results, baseline)
+        self.assertFalse(regressions, '\n'.join(regressions))
+
+
+class SeedShopTests(TestCase):
+    """Команда seed_shop: объёмы, связи заказов с товарами и распределения"""
+
+    def test_seed_small_shop(self):
+        call_command(
+            'seed_shop', products=50, users=10, orders=40, pickup_points=3,
+            items=(2, 3), price=(10, 20), days=30, stdout=StringIO(),
+        )
+        self.assertEqual(Product.objects.count(), 50)
+        self.assertEqual(User.objects.filter(profile__role='authorized').count(), 10)
+        self.assertEqual(Order.objects.count(), 40)
+        links = Order.products.through.objects.count()
+        self.assertTrue(80 <= links <= 120)
+        self.assertFalse(Product.objects.filter(price__lt=10).exists())
+        self.assertFalse(Product.objects.filter(price__gt=20).exists())
+        self.assertTrue(Order.objects.filter(createdAt__lt=timezone.now() - timedelta(days=1)).exists())
+
+
+class MetricsTests(TestCase):
+    """Метрики по представлениям и эндпоинт Prometheus"""
+
+    def setUp(self):
+        metrics.registry.reset()
+        self.admin = User.objects.create_user('metrics-admin', password='admin')
+        self.admin.profile.role = 'admin'
+        self.admin.profile.save()
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_records_latency_queries_and_size_per_view(self):
+        Product.objects.create(name='Товар', price=100, sku='SKU-M')
+        self.client.force_login(self.admin)
+        self.client.get(reverse('product_list'))
+
+        queries = metrics.registry.queries['product_list']
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.sum, 0)
+        self.assertEqual(metrics.registry.durations['product_list'].count, 1)
+        self.assertGreater(metrics.registry.sizes['product_list'].sum, 0)
+        self.assertEqual(metrics.registry.requests['product_list', 'GET', 200], 1)
+        self.assertIn(('product_list', 'miss'), metrics.registry.cache)
+
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'shop_db_queries_count{view="product_list"} 1')
+        self.assertContains(response, 'shop_request_duration_seconds_bucket{view="product_list",le="+Inf"} 1')
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_nothing_recorded_when_sampling_is_off(self):
+        self.client.get(reverse('product_list'))
+        self.assertEqual(metrics.registry.requests, {})
+
+    def test_endpoint_is_admin_only(self):
+        user = User.objects.create_user('metrics-user', password='user')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+
+class DbPoolStatsTests(TestCase):
+    """Статистика пула соединений: счётчики psycopg_pool и доступ к эндпоинту"""
+
+    def setUp(self):
+        self.admin = User.objects.create_user('pool-admin', password='admin')
+        self.admin.profile.role = 'admin'
+        self.admin.profile.save()
+
+    def fake_pool(self):
+        pool = mock.Mock()
+        pool.get_stats.side_effect = lambda: {
+            'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1, 'requests_waiting': 0,
+        }
+        return mock.patch.object(connections['default'], 'pool', pool, create=True)
+
+    def test_stats_of_pooled_connection(self):
+        with self.fake_pool():
+            self.assertEqual(get_pool_stats(), {'default': {
+                'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1,
+                'requests_waiting': 0, 'in_use': 3,
+            }})
+            self.client.force_login(self.admin)
+            response = self.client.get(reverse('db_pool_stats'))
+            self.assertEqual(response.json()['default']['in_use'], 3)
+            self.assertContains(self.client.get(reverse('metrics')),
+                                'shop_db_pool{alias="default",stat="in_use"} 3')
+
+    def test_no_pool(self):
+        with mock.patch.object(connections['default'], 'pool', None, create=True):
+            self.assertEqual(get_pool_stats(), {})
+            self.client.force_login(self.admin)
+            self.assertEqual(self.client.get(reverse('db_pool_stats')).json(), {})
+
+    def test_endpoint_is_admin_only(self):
+        url = reverse('db_pool_stats')
+        self.assertRedirects(self.client.get(url), reverse('login') + '?next=' + url, fetch_redirect_response=False)
+        self.client.force_login(User.objects.create_user('pool-user', password='user'))
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class ManageUsersTests(TestCase):
+    """Страница пользователей: постоянное число запросов, поиск, фильтр по роли"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', password='admin')
+        cls.admin.profile.role = 'admin'
+        cls.admin.profile.save()
+        for i in range(30):
+            User.objects.create_user(f'buyer{i:02d}')
+        editor = User.objects.create_user('Editor')
+        editor.profile.role = 'editor'
+        editor.profile.save()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_query_count_does_not_depend_on_users(self):
+        # сессия, пользователь с профилем, счётчики по ролям, страница с профилями
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('manage_users') + '?per_page=50')
+        self.assertEqual(len(response.context['users']), 32)
+        self.assertEqual(response.context['total'], 32)
+        self.assertIn(('editor', 'Редактор', 1), response.context['role_counts'])
+
+    def test_search_by_username_prefix_and_role(self):
+        response = self.client.get(reverse('manage_users') + '?search=BUYER1')
+        self.assertEqual([u.username for u in response.context['users']], [f'buyer1{i}' for i in range(10)])
+
+        response = self.client.get(reverse('manage_users') + '?role=editor')
+        self.assertEqual([u.username for u in response.context['users']], ['Editor'])
+
+    def test_pagination_walks_all_users(self):
+        url = reverse('manage_users') + '?per_page=7'
+        seen = []
+        response = self.client.get(url)
+        while True:
+            seen += [u.username for u in response.context['users']]
+            if not response.context['page'].has_next:
+                break
+            response = self.client.get(url + '&after=' + response.context['page'].next_cursor)
+        self.assertEqual(len(seen), 32)
+        self.assertEqual(seen, sorted(seen))
+
+
+class AdminChangelistTests(TestCase):
+    """Списки админки: фильтр по диапазонам цен, поиск по артикулу и названию"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_superuser('staff', password='staff')
+        Product.objects.create(name='Чайник', price=300, sku='A-1')
+        Product.objects.create(name='Кружка', price=700, sku='A-2')
+        order = Order.objects.create(user=cls.staff, pickupPoint=PickupPoint.objects.create(address='ул. Мира, 5'))
+        order.products.add(*Product.objects.all())
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def changelist(self, model, query=''):
+        return self.client.get(reverse(f'admin:bodies_{model}_changelist') + query)
+
+    def test_price_range_filter(self):
+        response = self.changelist('product', '?price_range=500-1000')
+        self.assertEqual([p.sku for p in response.context['cl'].result_list], ['A-2'])
+        self.assertContains(response, '500 – 1 000 ₽')
+        # Диапазоны совпадают с фильтром каталога
+        self.assertContains(response, '1 000 – 2 000 ₽')
+        self.assertContains(response, 'от 100 000 ₽')
+        response = self.changelist('product', '?price_range=100000-')
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_search_by_sku_and_name(self):
+        response = self.changelist('product', '?q=A-1')
+        self.assertEqual([p.sku for p in response.context['cl'].result_list], ['A-1'])
+        response = self.changelist('product', '?q=Кружка')
+        self.assertEqual([p.sku for p in response.context['cl'].result_list], ['A-2'])
+
+    def test_order_changelist_and_search(self):
+        order = Order.objects.get()
+        response = self.changelist('order', f'?q={order.receiveCode}')
+        self.assertEqual(list(response.context['cl'].result_list), [order])
+        self.assertEqual(self.client.get(reverse('admin:bodies_order_change', args=[order.id])).status_code, 200)
+
+
+class LoginWritesTests(TestCase):
+    """Вход не пишет в профиль, last_login обновляется не чаще интервала"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='buyer')
+
+    def login(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'buyer'})
+        self.assertEqual(response.status_code, 302)
+        return [q['sql'] for q in queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+
+    def test_login_updates_last_login_once_per_interval(self):
+        writes = self.login()
+        self.assertFalse([sql for sql in writes if 'bodies_profile' in sql])
+        self.assertEqual(len([sql for sql in writes if 'auth_user' in sql]), 1)
+        self.assertIsNotNone(User.objects.get(pk=self.user.pk).last_login)
+
+        self.client.logout()
+        writes = self.login()
+        self.assertFalse([sql for sql in writes if 'auth_user' in sql or 'bodies_profile' in sql])
+
+    @override_settings(LAST_LOGIN_UPDATE_INTERVAL=None)
+    def test_last_login_update_can_be_disabled(self):
+        self.login()
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_login)
+
+    def test_profile_saved_only_when_changed(self):
+        user = User.objects.select_related('profile').get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            user.save()
+        user.profile.role = 'editor'
+        with self.assertNumQueries(2):
+            user.save()
+        self.assertEqual(Profile.objects.get(user=user).role, 'editor')
+
+
+class PriceFacetsTests(TestCase):
+    """Фильтр по цене в Decimal и счётчики диапазонов цен"""
+
+    def counts(self):
+        return {bucket.lower: bucket.count for bucket in PriceBucket.objects.all() if bucket.count}
+
+    def test_buckets_follow_save_delete_and_import(self):
+        cheap = Product.objects.create(name='Ложка', price=Decimal('499.99'), sku='P-1')
+        Product.objects.create(name='Стол', price=Decimal('1500'), sku='P-2')
+        self.assertEqual(self.counts(), {Decimal(0): 1, Decimal(1000): 1})
+
+        cheap = Product.objects.get(pk=cheap.pk)
+        cheap.price = Decimal('500')
+        cheap.save()
+        self.assertEqual(self.counts(), {Decimal(500): 1, Decimal(1000): 1})
+
+        cheap.delete()
+        self.assertEqual(self.counts(), {Decimal(1000): 1})
+
+        from scripts.import_products import import_rows
+        import_rows([
+            (2, {'name': 'Стол', 'sku': 'P-2', 'price': '25000'}),
+            (3, {'name': 'Стул', 'sku': 'P-3', 'price': '99,50'}),
+        ])
+        self.assertEqual(self.counts(), {Decimal(0): 1, Decimal(20000): 1})
+        rebuild_price_buckets()
+        self.assertEqual(self.counts(), {Decimal(0): 1, Decimal(20000): 1})
+
+    def test_price_filter_is_exact_and_shows_facets(self):
+        user = User.objects.create_user('buyer')
+        self.client.force_login(user)
+        Product.objects.create(name='Ложка', price=Decimal('0.30'), sku='P-1')
+        Product.objects.create(name='Вилка', price=Decimal('0.10'), sku='P-2')
+
+        response = self.client.get(reverse('product_list') + '?price_min=0,3&price_max=abc')
+        self.assertEqual([p.sku for p in response.context['products']], ['P-1'])
+        self.assertContains(response, 'до 500 ₽ (2)')
+
+    def test_product_forms_save_decimal_price(self):
+        admin = User.objects.create_user('boss')
+        admin.profile.role = 'admin'
+        admin.profile.save()
+        self.client.force_login(admin)
+
+        response = self.client.post(reverse('add_product'), {'name': 'Стол', 'sku': 'P-1', 'price': '1500,50'})
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        table = Product.objects.get(sku='P-1')
+        self.assertEqual(table.price, Decimal('1500.50'))
+        self.assertEqual(self.counts(), {Decimal(1000): 1})
+
+        response = self.client.post(reverse('edit_product', args=[table.pk]), {
+            'name': 'Стол', 'sku': 'P-1', 'price': '450', 'description': '',
+        })
+        self.assertRedirects(response, reverse('product_list'), fetch_redirect_response=False)
+        self.assertEqual(Product.objects.get(pk=table.pk).price, Decimal('450.00'))
+        self.assertEqual(self.counts(), {Decimal(0): 1})
+
+        for url, data in [
+            (reverse('add_product'), {'name': 'Стул', 'sku': 'P-2', 'price': 'дёшево'}),
+            (reverse('add_product'), {'name': 'Стул', 'sku': 'P-2', 'price': ''}),
+            (reverse('edit_product', args=[table.pk]), {'name': 'Стол', 'sku': 'P-1', 'price': '1e20'}),
+        ]:
+            with self.subTest(data['price']):
+                response = self.client.post(url, data)
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.context['error'])
+        self.assertEqual(list(Product.objects.values_list('sku', 'price')), [('P-1', Decimal('450.00'))])
+        self.assertEqual(self.counts(), {Decimal(0): 1})
+
+    def test_price_change_deltas_accepts_unsaved_values(self):
+        self.assertEqual(price_change_deltas(['499.99', None], [500, '20000.00']), {
+            Decimal(0): -1, Decimal(500): 1, Decimal(20000): 1,
+        })
+
+
+class CatalogApiTests(TestCase):
+    """JSON API каталога: поля, курсоры, потоковая выдача, ответы 304"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create(
+            Product(name=f'Товар {i}', sku=f'API-{i}', price=Decimal(100 + i), version=Product.next_version())
+            for i in range(5)
+        )
+
+    def get(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        if response.streaming:
+            response.json_body = json.loads(b''.join(response.streaming_content))
+        return response
+
+    def test_fields_and_keyset_walk(self):
+        url = reverse('api_products') + '?fields=sku,price&per_page=2'
+        skus = []
+        cursor = ''
+        for _ in range(3):
+            response = self.get(url + cursor)
+            self.assertEqual(response.status_code, 200)
+            body = response.json_body
+            self.assertTrue(all(set(item) == {'sku', 'price'} for item in body['results']))
+            skus += [item['sku'] for item in body['results']]
+            if not body['next']:
+                break
+            cursor = f'&after={body["next"]}'
+        self.assertEqual(skus, [f'API-{i}' for i in reversed(range(5))])
+        self.assertIsNone(body['next'])
+        self.assertEqual(self.get(reverse('api_products') + '?fields=password').status_code, 400)
+
+    def test_unchanged_catalog_is_not_read(self):
+        response = self.get(reverse('api_products'))
+        etag = response['ETag']
+        # Только строка версии каталога
+        with self.assertNumQueries(1):
+            response = self.get(reverse('api_products'), if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_delete_changes_etag(self):
+        etag = self.get(reverse('api_products'))['ETag']
+        # Самый новый товар: Max('version') после удаления не вырос бы
+        Product.objects.order_by('-version').first().delete()
+        # Версия в базе, а не в кэше процесса: другой процесс видит то же
+        cache.clear()
+        response = self.get(reverse('api_products'), if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json_body['results']), 4)
+
+    def test_bulk_updates_change_etag(self):
+        etag = self.get(reverse('api_products'))['ETag']
+        Product.objects.filter(sku='API-0').update(price=Decimal(1))
+        response = self.get(reverse('api_products'), if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        products = list(Product.objects.all())
+        for product in products:
+            product.description = 'Новое'
+        Product.objects.bulk_update(products, ['description'], batch_size=2)
+        self.assertEqual(self.get(reverse('api_products'), if_none_match=etag).status_code, 200)
+
+    def test_version_rolls_back_with_transaction(self):
+        from django.db import transaction
+        version = catalog_version()
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            bump_catalog_version()
+            self.assertGreater(catalog_version(), version)
+            1 / 0
+        self.assertEqual(catalog_version(), version)
+
+    def test_product_detail(self):
+        product = Product.objects.first()
+        url = reverse('api_product_detail', args=[product.pk])
+        response = self.get(url)
+        self.assertEqual(response.json()['sku'], product.sku)
+        self.assertEqual(self.get(url, if_none_match=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(reverse('api_product_detail', args=[0])).status_code, 404)
+
+
+class ExportTests(TestCase):
+    """Выгрузка товаров и заказов: CSV потоком, XLSX, обратный импорт"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin')
+        cls.admin.profile.role = 'admin'
+        cls.admin.profile.save()
+        cls.spoon = Product.objects.create(name='Ложка, "чайная"', price=Decimal('99.50'), sku='E-1')
+        cls.table = Product.objects.create(name='Стол', price=Decimal('1500'), sku='E-2', description='Дуб\nмассив')
+        point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.order = Order.place(cls.admin, point, [cls.spoon, cls.table])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_product_csv_round_trips_through_import(self):
+        response = self.client.get(reverse('export_products'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment', response['Content-Disposition'])
+        path = Path(tempfile.mkdtemp()) / 'products.csv'
+        path.write_bytes(b''.join(response.streaming_content))
+
+        Product.objects.filter(pk=self.spoon.pk).update(name='Другое', price=1)
+        from scripts.import_products import import_csv
+        stats = import_csv(path)
+        self.assertEqual((stats.updated, stats.unchanged, stats.rejected), (1, 1, []))
+        spoon = Product.objects.get(pk=self.spoon.pk)
+        self.assertEqual((spoon.name, spoon.price), ('Ложка, "чайная"', Decimal('99.50')))
+
+    def test_orders_csv_and_xlsx(self):
+        response = self.client.get(reverse('export_orders') + '?since=2000-01-01')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()))
+        self.assertEqual(rows[0][-1], 'skus')
+        self.assertEqual(rows[1][2:5], ['new', 'admin', 'ул. Ленина, 1'])
+        self.assertEqual(rows[1][-1], 'E-1 E-2')
+
+        response = self.client.get(reverse('export_orders') + '?until=2000-01-01')
+        self.assertEqual(len(b''.join(response.streaming_content).decode('utf-8-sig').splitlines()), 1)
+
+        from openpyxl import load_workbook
+        response = self.client.get(reverse('export_orders') + '?format=xlsx')
+        path = Path(tempfile.mkdtemp()) / 'orders.xlsx'
+        path.write_bytes(b''.join(response.streaming_content))
+        sheet = load_workbook(path, read_only=True).active
+        self.assertEqual(list(sheet.iter_rows(values_only=True))[1][-1], 'E-1 E-2')
+
+    async def test_orders_csv_streams_under_asgi(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('export_orders'))
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertTrue(content.decode('utf-8-sig').splitlines()[1].endswith('E-1 E-2'))
+
+    def test_command_and_permissions(self):
+        out = StringIO()
+        call_command('export_shop', 'orders', stdout=out)
+        self.assertIn(self.order.receiveCode, out.getvalue())
+        path = Path(tempfile.mkdtemp()) / 'products.xlsx'
+        call_command('export_shop', 'products', '-o', str(path), stderr=StringIO())
+        self.assertTrue(path.stat().st_size)
+
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertEqual(self.client.get(reverse('export_orders')).status_code, 403)
+
+
+class SalesReportTests(TestCase):
+    """Счётчики отчётов меняются вместе с заказами и совпадают с пересчётом"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin')
+        cls.admin.profile.role = 'admin'
+        cls.admin.profile.save()
+        cls.products = [
+            Product.objects.create(name=f'Товар {i}', price=Decimal(100), sku=f'R-{i}') for i in range(3)
+        ]
+        cls.points = [PickupPoint.objects.create(address=f'ул. Отчётная, {i}') for i in range(2)]
+
+    def snapshot(self):
+        return (
+            sorted(StatusDailyOrders.objects.filter(orders__gt=0).values_list('day', 'status', 'orders')),
+            sorted(PickupPointDailyOrders.objects.filter(orders__gt=0).values_list('day', 'pickupPoint', 'orders')),
+            sorted(ProductDailySales.objects.filter(orders__gt=0).values_list('day', 'product', 'orders')),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.snapshot()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.snapshot())
+        return incremental
+
+    def test_rollups_follow_order_changes(self):
+        first = Order.place(self.admin, self.points[0], self.products[:2])
+        second = Order.place(self.admin, self.points[1], self.products[1:])
+        statuses, points, products = self.assertMatchesRebuild()
+        self.assertEqual([row[1:] for row in statuses], [('new', 2)])
+        self.assertEqual([row[2] for row in products], [1, 2, 1])
+
+        Order.objects.filter(pk=first.pk).mark_delivered()
+        order = Order.objects.get(pk=second.pk)
+        order.pickupPoint = self.points[0]
+        order.status = 'delivered'
+        order.save()
+        statuses, points, _ = self.assertMatchesRebuild()
+        self.assertEqual([row[1:] for row in statuses], [('delivered', 2)])
+        self.assertEqual([row[1:] for row in points], [(self.points[0].pk, 2)])
+
+        order.products.remove(self.products[2])
+        order.products.add(self.products[0])
+        self.products[1].order_set.clear()
+        self.assertMatchesRebuild()
+
+        first.delete()
+        statuses, _, products = self.assertMatchesRebuild()
+        self.assertEqual([row[1:] for row in statuses], [('delivered', 1)])
+        self.assertEqual([row[1:] for row in products], [(self.products[0].pk, 1)])
+
+    def test_seeded_orders_are_counted(self):
+        seeding.seed_orders(
+            50, [self.admin.pk], [point.pk for point in self.points], [product.pk for product in self.products],
+            items=(1, 3), days=10, delivered_share=0.5, rng=random.Random(1),
+        )
+        statuses, _, _ = self.assertMatchesRebuild()
+        self.assertEqual(sum(row[2] for row in statuses), 50)
+
+    def test_dashboard_reads_only_rollups(self):
+        Order.place(self.admin, self.points[0], self.products)
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('sales_report') + '?days=7')
+        self.assertEqual(response.context['total'], 1)
+        self.assertEqual(len(response.context['products']), 3)
+        self.assertFalse([q['sql'] for q in queries if 'bodies_order' in q['sql']])
+
+        self.client.force_login(User.objects.create_user('buyer'))
+        self.assertEqual(self.client.get(reverse('sales_report')).status_code, 403)
+
+
+class ObjectCacheTests(TestCase):
+    """Кэш товаров и пунктов выдачи: чтение через кэш, сброс при изменениях, счётчики"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Чайник', price=Decimal(100), sku='OC 1')
+        cls.point = PickupPoint.objects.create(address='ул. Кэшевая, 1')
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+
+    def test_product_read_through_and_invalidation(self):
+        with self.assertNumQueries(1):
+            objectcache.get_product(self.product.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(objectcache.get_product(self.product.pk).name, 'Чайник')
+            self.assertEqual(objectcache.get_product(sku='OC 1').pk, self.product.pk)
+        self.assertIsNone(objectcache.get_product(sku='нет такого'))
+
+        product = objectcache.get_product(self.product.pk)
+        product.sku = 'OC 2'
+        product.save()
+        self.assertIsNone(objectcache.get_product(sku='OC 1'))
+        self.assertEqual(objectcache.get_product(sku='OC 2').pk, self.product.pk)
+
+        # update() не читает id изменённых строк, а сбрасывает все товары
+        other = objectcache.get_product(Product.objects.create(name='Ложка', price=1, sku='OC 9').pk)
+        with CaptureQueriesContext(connection) as queries:
+            Product.objects.filter(pk=self.product.pk).update(name='Чайник 2')
+        self.assertFalse([q['sql'] for q in queries if q['sql'].startswith('SELECT')])
+        self.assertEqual(objectcache.get_product(self.product.pk).name, 'Чайник 2')
+        with self.assertNumQueries(1):
+            self.assertEqual(objectcache.get_product(other.pk), other)
+
+        from scripts.import_products import import_rows
+        import_rows([(2, {'name': 'Чайник 3', 'sku': 'OC 2', 'price': '100'})])
+        self.assertEqual(objectcache.get_product(sku='OC 2').name, 'Чайник 3')
+
+        self.assertEqual(metrics.registry.objects[('product', 'hit')], 3)
+        self.assertIn('shop_object_cache_requests_total{model="product",result="miss"}', metrics.render_prometheus())
+
+    def test_pickup_points_bulk_changes(self):
+        self.assertEqual(objectcache.pickup_points()[0].address, 'ул. Кэшевая, 1')
+        PickupPoint.objects.filter(pk=self.point.pk).update(address='ул. Кэшевая, 3')
+        self.assertEqual(objectcache.get_pickup_point(self.point.pk).address, 'ул. Кэшевая, 3')
+
+        self.point.address = 'ул. Кэшевая, 4'
+        PickupPoint.objects.bulk_update([self.point], ['address'])
+        self.assertEqual([point.address for point in objectcache.pickup_points()], ['ул. Кэшевая, 4'])
+
+    def test_pickup_points_and_purchase_use_cache(self):
+        self.assertEqual(objectcache.pickup_points(), [self.point])
+        other = PickupPoint.objects.create(address='ул. Кэшевая, 2')
+        self.assertEqual(objectcache.get_pickup_point(other.pk), other)
+
+        user = User.objects.create_user('buyer')
+        self.client.force_login(user)
+        url = reverse('create_order', args=[self.product.pk, self.point.pk])
+        self.client.post(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.post(url).status_code, 302)
+        lookups = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and (
+            'FROM "bodies_product"' in q['sql'] or 'FROM "bodies_pickuppoint"' in q['sql'])]
+        self.assertEqual(lookups, [])
+        self.assertEqual(Order.objects.filter(user=user).count(), 2)
+        self.assertEqual(self.client.post(reverse('create_order', args=[self.product.pk, 0])).status_code, 404)
+
+    def test_writes_use_primary_row_not_cached_copy(self):
+        admin = User.objects.create_user('boss')
+        admin.profile.role = 'admin'
+        admin.profile.save()
+        self.client.force_login(admin)
+        # В кэше устаревшая копия товара (например, другой процесс её не сбросил)
+        stale = objectcache.get_product(self.product.pk)
+        Product.objects.filter(pk=self.product.pk).update(description='Новое описание')
+        key = objectcache.PRODUCT_KEY.format(self.product.pk)
+        stale_entry = (cache.get(objectcache.PRODUCT_GENERATION_KEY), stale)
+        cache.set(key, stale_entry)
+
+        response = self.client.get(reverse('edit_product', args=[self.product.pk]))
+        self.assertEqual(response.context['product'].description, '')
+        self.client.post(reverse('edit_product', args=[self.product.pk]), {'name': 'Чайник 2', 'price': '150'})
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.name, product.description), ('Чайник 2', 'Новое описание'))
+
+        cache.set(key, stale_entry)
+        self.client.post(reverse('delete_product', args=[self.product.pk]))
+        self.assertFalse(Product.objects.filter(pk=self.product.pk).exists())
+        self.assertEqual(self.client.post(reverse('delete_product', args=[self.product.pk])).status_code, 404)
+
+
+class RoleMiddlewareTests(TestCase):
+    """Роль вычисляется лениво: запросы без неё не читают сессию и пользователя"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('boss', password='boss')
+        cls.admin.profile.role = 'admin'
+        cls.admin.profile.save()
+        PickupPoint.objects.create(address='ул. Ленина, 1')
+
+    def setUp(self):
+        self.client.login(username='boss', password='boss')
+
+    def test_role_not_loaded_when_unused(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api_pickup_points'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_role_in_sync_and_async_views(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertEqual(response.context['card_variant'], 'admin')
+        self.assertEqual(response.context['user_role'], 'admin')
+        self.assertEqual(self.client.get(reverse('manage_users')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('add_product')).status_code, 200)
+
+
+class ProductCardCacheTests(TestCase):
+    """Карточки товаров кэшируются по (id, версия, роль)"""
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Чайник', sku='KT-1', price=Decimal('990.00'))
+
+    def card_key(self, product, role='unauthorized'):
+        return make_template_fragment_key('product_card', [product.id, product.version, role])
+
+    def test_card_is_served_from_cache(self):
+        self.client.get(reverse('product_list'))
+        self.assertIn('Чайник', cache.get(self.card_key(self.product)))
+        cache.set(self.card_key(self.product), '<div>из кэша</div>')
+        self.assertContains(self.client.get(reverse('product_list')), 'из кэша')
+
+    def test_save_changes_key_and_delete_drops_cards(self):
+        self.client.get(reverse('product_list'))
+        old_key = self.card_key(self.product)
+
+        self.product.name = 'Самовар'
+        self.product.save()
+        self.assertNotEqual(self.card_key(self.product), old_key)
+        response = self.client.get(reverse('product_list'))
+        self.assertContains(response, 'Самовар')
+        self.assertNotContains(response, 'Чайник')
+
+        key = self.card_key(self.product)
+        self.assertIsNotNone(cache.get(key))
+        self.product.delete()
+        self.assertIsNone(cache.get(key))
+
+    def test_bulk_update_changes_card(self):
+        self.assertContains(self.client.get(reverse('product_list')), '990.00 р.')
+        version = self.product.version
+        Product.objects.filter(pk=self.product.pk).update(price=Decimal('1290.00'))
+        self.product.refresh_from_db()
+        self.assertGreater(self.product.version, version)
+        response = self.client.get(reverse('product_list'))
+        self.assertContains(response, '1290.00 р.')
+        self.assertNotContains(response, '990.00 р.')
+
+
+class ImportProductsTests(TestCase):
+    """Импорт товаров: upsert по артикулу порциями, версия меняется только у изменённых"""
+
+    def setUp(self):
+        self.kettle = Product.objects.create(name='Чайник', sku='KT-1', price=Decimal('990.00'))
+        self.mug = Product.objects.create(name='Кружка', sku='MG-1', price=Decimal('250.00'))
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_csv(self, rows, delimiter=';'):
+        path = Path(self.directory.name) / 'products.csv'
+        with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+            writer = csv.writer(file, delimiter=delimiter)
+            writer.writerow(['Артикул', 'Название', 'Цена', 'Описание'])
+            writer.writerows(rows)
+        return str(path)
+
+    def test_csv_upsert_and_versions(self):
+        from scripts.import_products import import_csv
+        path = self.write_csv([
+            ['KT-1', 'Чайник электрический', '1090,50', ''],
+            ['MG-1', 'Кружка', '250', ''],
+            ['LM-1', 'Лампа', '1500', 'Настольная'],
+            ['BAD-1', 'Без цены', '', ''],
+            ['LM-2', 'Лампа', 'дорого', ''],
+        ])
+        kettle_version, mug_version = self.kettle.version, self.mug.version
+
+        stats = import_csv(path)
+
+        self.assertEqual(
+            (stats.inserted, stats.updated, stats.unchanged, [line for line, _ in stats.rejected]),
+            (1, 1, 1, [5, 6]),
+        )
+        self.kettle.refresh_from_db()
+        self.mug.refresh_from_db()
+        self.assertEqual((self.kettle.name, self.kettle.price), ('Чайник электрический', Decimal('1090.50')))
+        self.assertGreater(self.kettle.version, kettle_version)
+        self.assertEqual(self.mug.version, mug_version)
+        lamp = Product.objects.get(sku='LM-1')
+        self.assertEqual((lamp.price, lamp.description), (Decimal('1500.00'), 'Настольная'))
+        self.assertEqual(lamp.version, self.kettle.version)
+
+    def test_queries_per_chunk_do_not_depend_on_rows(self):
+        from scripts.import_products import import_csv
+        rows = [[f'N-{i}', f'Товар {i}', str(100 + i), ''] for i in range(40)]
+        # На порцию: SELECT артикулов, INSERT ... ON CONFLICT, UPDATE счётчиков
+        # цен и версии каталога, начало/конец транзакции (в тесте — точка сохранения)
+        with self.assertNumQueries(4 * 6):
+            stats = import_csv(self.write_csv(rows), chunk_size=10)
+        self.assertEqual(stats.inserted, 40)
+
+    def test_report_goes_to_current_stdout(self):
+        from contextlib import redirect_stdout
+        from scripts.import_products import import_csv
+        stats = import_csv(self.write_csv([['LM-1', 'Лампа', '1500', ''], ['BAD-1', 'Без цены', '', '']]))
+        with redirect_stdout(StringIO()) as out:
+            stats.report()
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'строка 3: не заполнено: price')
+        self.assertEqual(lines[1], 'добавлено: 1, обновлено: 0, без изменений: 0, отклонено: 1')
+
+    def test_xlsx_import_matches_csv(self):
+        from openpyxl import Workbook
+        from scripts.import_products import import_file
+        path = Path(self.directory.name) / 'products.xlsx'
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(['sku', 'name', 'price', 'description'])
+        sheet.append(['KT-1', 'Чайник электрический', 1090.5, None])
+        sheet.append(['MG-1', 'Кружка', 250.0, None])
+        sheet.append([None, None, None, None])
+        sheet.append(['LM-1', 'Лампа', 1500, 'Настольная'])
+        workbook.save(path)
+        kettle_version, mug_version = self.kettle.version, self.mug.version
+
+        stats = import_file(str(path))
+
+        self.assertEqual((stats.inserted, stats.updated, stats.unchanged, stats.rejected), (1, 1, 1, []))
+        self.kettle.refresh_from_db()
+        self.mug.refresh_from_db()
+        self.assertEqual(self.kettle.price, Decimal('1090.50'))
+        self.assertGreater(self.kettle.version, kettle_version)
+        self.assertEqual(self.mug.version, mug_version)
+        self.assertEqual(Product.objects.get(sku='LM-1').price, Decimal('1500.00'))
+
+
+class ServeMediaTests(SimpleTestCase):
+    """Раздача медиа: 200, 304, диапазоны 206 и 416"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=directory.name, MEDIA_ACCEL_REDIRECT_PREFIX='')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.data = bytes(range(100))
+        (Path(directory.name) / 'thumbs').mkdir()
+        (Path(directory.name) / 'thumbs' / 'ab-320.webp').write_bytes(self.data)
+        (Path(directory.name) / 'photo.jpg').write_bytes(self.data)
+        self.factory = RequestFactory()
+
+    def get(self, path, **headers):
+        return serve_media(self.factory.get('/media/' + path, headers=headers), path)
+
+    def test_full_file_and_not_modified(self):
+        response = self.get('photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('immutable', self.get('thumbs/ab-320.webp')['Cache-Control'])
+
+        not_modified = self.get('photo.jpg', if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+        self.assertEqual(self.get('photo.jpg', if_modified_since=response['Last-Modified']).status_code, 304)
+
+    def test_ranges(self):
+        for header, start, end in [('bytes=10-19', 10, 19), ('bytes=90-', 90, 99),
+                                   ('bytes=-5', 95, 99), ('bytes=95-500', 95, 99), ('bytes=-500', 0, 99)]:
+            with self.subTest(header):
+                response = self.get('photo.jpg', range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content), self.data[start:end + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/100')
+                self.assertEqual(int(response['Content-Length']), end - start + 1)
+
+        unsatisfiable = self.get('photo.jpg', range='bytes=100-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], 'bytes */100')
+        # Несколько диапазонов и устаревший If-Range — файл целиком
+        self.assertEqual(self.get('photo.jpg', range='bytes=0-1,5-6').status_code, 200)
+        self.assertEqual(self.get('photo.jpg', range='bytes=0-1', if_range='"stale"').status_code, 200)
+
+    def test_missing_and_outside_media_root(self):
+        for path in ('nope.jpg', '../settings.py', 'thumbs'):
+            with self.subTest(path), self.assertRaises(Http404):
+                self.get(path)
+
+
+class ProductImageTests(TestCase):
+    """Миниатюры: варианты по хэшу содержимого, srcset в шаблоне, generate_thumbnails"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = override_settings(MEDIA_ROOT=directory.name, MEDIA_URL='/media/')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media = Path(directory.name)
+
+    def upload(self, name='photo.jpg', color='red'):
+        buffer = BytesIO()
+        Image.new('RGB', (1000, 800), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def generate_thumbnails(self, *args):
+        # Потоки вместо процессов: тест идёт внутри транзакции TestCase
+        out = StringIO()
+        with mock.patch('bodies.management.commands.generate_thumbnails.ProcessPoolExecutor', ThreadPoolExecutor), \
+                mock.patch('bodies.management.commands.generate_thumbnails.connections.close_all'):
+            call_command('generate_thumbnails', '--workers', '2', *args, stdout=out, stderr=StringIO())
+        return out.getvalue().strip()
+
+    def test_upload_builds_variants(self):
+        upload = self.upload()
+        expected_hash = content_hash(upload)
+        product = Product.objects.create(name='Лампа', price=100, sku='IMG-1', image=upload)
+
+        self.assertEqual(product.image_hash, expected_hash)
+        for width in THUMBNAIL_WIDTHS:
+            for fmt, pil_format in [('webp', 'WEBP'), ('jpeg', 'JPEG')]:
+                name = variant_name(product.image_hash, width, fmt)
+                self.assertTrue(name.startswith(f'thumbs/{expected_hash[:2]}/{expected_hash}_{width}'))
+                with Image.open(self.media / name) as thumbnail:
+                    self.assertEqual(thumbnail.format, pil_format)
+                    self.assertEqual(thumbnail.width, width)
+
+        # Та же картинка под другим именем не порождает новых файлов
+        files = sorted(self.media.joinpath('thumbs').rglob('*'))
+        twin = Product.objects.create(name='Лампа 2', price=100, sku='IMG-2', image=self.upload('copy.jpg'))
+        self.assertEqual(twin.image_hash, product.image_hash)
+        self.assertEqual(sorted(self.media.joinpath('thumbs').rglob('*')), files)
+
+    def test_picture_tag(self):
+        product = Product.objects.create(name='Лампа', price=100, sku='IMG-1', image=self.upload())
+        template = Template('{% load product_images %}{% product_picture product %}')
+        html = template.render(Context({'product': product}))
+
+        thumbs = f'/media/thumbs/{product.image_hash[:2]}/{product.image_hash}'
+        self.assertIn('<picture>', html)
+        self.assertIn(f'<source type="image/webp" srcset="{thumbs}_320.webp 320w, {thumbs}_640.webp 640w"', html)
+        self.assertIn(f'<img src="{thumbs}_320.jpg" srcset="{thumbs}_320.jpg 320w, {thumbs}_640.jpg 640w"', html)
+        self.assertIn('sizes="(max-width: 600px) 100vw, 320px"', html)
+
+        # Без хэша — обычный <img> с оригиналом
+        Product.objects.filter(pk=product.pk).update(image_hash='')
+        product.refresh_from_db()
+        html = template.render(Context({'product': product}))
+        self.assertNotIn('<picture>', html)
+        self.assertIn(f'<img src="{product.image.url}"', html)
+
+    def test_generate_thumbnails(self):
+        products = [
+            Product.objects.create(name=f'Лампа {i}', price=100, sku=f'IMG-{i}', image=self.upload(color=color))
+            for i, color in enumerate(['red', 'blue'])
+        ]
+        hashes = {product.pk: product.image_hash for product in products}
+        Product.objects.filter(pk__in=hashes).update(image_hash='')
+        for path in self.media.joinpath('thumbs').rglob('*.*'):
+            path.unlink()
+        versions = dict(Product.objects.values_list('pk', 'version'))
+        etag = catalog_version()
+
+        self.assertEqual(self.generate_thumbnails(), 'готово: 2, ошибок: 0')
+        for pk, image_hash, version in Product.objects.values_list('pk', 'image_hash', 'version'):
+            self.assertEqual(image_hash, hashes[pk])
+            self.assertGreater(version, versions[pk])
+            self.assertTrue((self.media / variant_name(image_hash, 640, 'webp')).exists())
+        self.assertGreater(catalog_version(), etag)
+
+        # Повторный запуск: обрабатывать нечего, версии не меняются
+        versions = dict(Product.objects.values_list('pk', 'version'))
+        self.assertEqual(self.generate_thumbnails(), 'готово: 0, ошибок: 0')
+        self.assertEqual(dict(Product.objects.values_list('pk', 'version')), versions)
+
+        # --force обрабатывает все товары заново с теми же хэшами
+        self.assertEqual(self.generate_thumbnails('--force'), 'готово: 2, ошибок: 0')
+        self.assertEqual(dict(Product.objects.values_list('pk', 'image_hash')), hashes)
+
+
+class CheckoutTests(TestCase):
+    """Оформление корзины: один заказ в одной транзакции, запросы не зависят от размера корзины"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='buyer')
+        cls.point = PickupPoint.objects.create(address='ул. Ленина, 1')
+        cls.products = [
+            Product.objects.create(name=f'Товар {i}', sku=f'SKU-{i}', price=Decimal('100.00'))
+            for i in range(6)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='buyer', password='buyer')
+
+    def fill_cart(self, products):
+        for product in products:
+            self.client.post(reverse('cart_add'), {'product_id': product.id})
+
+    def checkout(self, pickup_point_id):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('checkout'), {'pickup_point_id': pickup_point_id})
+        return response, queries
+
+    def test_order_is_placed_in_one_transaction(self):
+        counts = []
+        for products in (self.products[:2], self.products):
+            cache.clear()
+            self.fill_cart(products)
+            response, queries = self.checkout(self.point.id)
+            self.assertRedirects(response, reverse('order_list'), fetch_redirect_response=False)
+            order = Order.objects.latest('id')
+            self.assertEqual({p.id for p in order.products.all()}, {p.id for p in products})
+            self.assertEqual(self.client.session.get('cart', []), [])
+
+            # Заказ, его товары и счётчики отчётов пишутся внутри одного
+            # atomic() (в тесте — точка сохранения), сессия — после него
+            sql = [query['sql'] for query in queries.captured_queries]
+            first = next(i for i, statement in enumerate(sql) if statement.startswith('SAVEPOINT'))
+            release = sql.index('RELEASE ' + sql[first])
+            writes = [i for i, statement in enumerate(sql)
+                      if statement.startswith('INSERT') and 'bodies_' in statement]
+            self.assertEqual(len(writes), 5)
+            self.assertTrue(first < min(writes) and max(writes) < release)
+            counts.append(len(sql))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_bad_pickup_point_and_missing_products(self):
+        self.fill_cart(self.products[:2])
+        for pickup_point_id in ('abc', '', str(self.point.id + 100)):
+            with self.subTest(pickup_point_id):
+                self.assertEqual(self.checkout(pickup_point_id)[0].status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+        Product.objects.filter(pk=self.products[0].pk).delete()
+        response, _ = self.checkout(self.point.id)
+        self.assertRedirects(response, reverse('cart') + '?error=missing', fetch_redirect_response=False)
+        self.assertEqual(self.client.session['cart'], [self.products[1].id])
+        self.assertFalse(Order.objects.exists())
+
+
+class PickupDeskTests(TestCase):
+    """Выдача заказов: поиск по кодам, массовая выдача, повтор кода получения"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = User.objects.create_user('buyer', password='buyer')
+        editor = User.objects.create_user('clerk', password='clerk')
+        editor.profile.role = 'editor'
+        editor.profile.save()
+        cls.point, cls.other_point = (
+            PickupPoint.objects.create(address='ул. Ленина, 1'),
+            PickupPoint.objects.create(address='ул. Мира, 2'),
+        )
+        product = Product.objects.create(name='Чайник', sku='KT-1', price=Decimal('990.00'))
+        cls.orders = [Order.place(cls.buyer, cls.point, [product]) for _ in range(3)]
+        cls.elsewhere = Order.place(cls.buyer, cls.other_point, [product])
+
+    def setUp(self):
+        self.client.login(username='clerk', password='clerk')
+
+    def test_search_by_codes(self):
+        counts = []
+        for orders in (self.orders[:1], self.orders):
+            cache.clear()
+            codes = ' '.join(order.receiveCode.lower() for order in orders)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('pickup_desk'), {'pickup_point': self.point.id, 'codes': codes})
+            self.assertEqual({order.id for order in response.context['orders']}, {o.id for o in orders})
+            counts.append(len(queries))
+        # Заказы, пользователи и товары — по одному запросу на любое число кодов
+        self.assertEqual(counts[0], counts[1])
+
+        response = self.client.get(reverse('pickup_desk'), {
+            'pickup_point': self.point.id, 'codes': self.elsewhere.receiveCode,
+        })
+        self.assertEqual(list(response.context['orders']), [])
+
+    def test_mark_delivered(self):
+        response = self.client.post(reverse('pickup_desk_deliver'), {
+            'pickup_point': self.point.id,
+            'order': [self.orders[0].id, self.orders[1].id, self.elsewhere.id, 'x'],
+        })
+        self.assertRedirects(
+            response, reverse('pickup_desk') + f'?pickup_point={self.point.id}&delivered=2',
+            fetch_redirect_response=False,
+        )
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        self.assertEqual(
+            [statuses[order.id] for order in [*self.orders, self.elsewhere]],
+            ['delivered', 'delivered', 'new', 'new'],
+        )
+        self.assertIsNotNone(Order.objects.get(pk=self.orders[0].pk).deliveryDate)
+        # Уже выданные заказы повторно не считаются
+        self.assertEqual(Order.objects.filter(pk=self.orders[0].pk).mark_delivered(), 0)
+
+    def test_receive_code_collision_is_retried(self):
+        taken = self.orders[0].receiveCode
+        with mock.patch('bodies.models.generate_receive_code', return_value='NEW001'):
+            order = Order.objects.create(user=self.buyer, pickupPoint=self.point, receiveCode=taken)
+            self.assertEqual(order.receiveCode, 'NEW001')
+            # В другом пункте выдачи тот же код допустим
+            order = Order.objects.create(user=self.buyer, pickupPoint=self.other_point, receiveCode=taken)
+            self.assertEqual(order.receiveCode, taken)
+
+        with mock.patch('bodies.models.generate_receive_code', return_value=taken):
+            with self.assertRaises(IntegrityError):
+                Order.objects.create(user=self.buyer, pickupPoint=self.point, receiveCode=taken)
+
+
+class ProductListTests(TestCase):
+    """Каталог: курсорная пагинация вперёд и назад, фильтры, постоянное число запросов"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', password='buyer')
+        cls.products = [
+            Product.objects.create(
+                name=f'{"Чайник" if i % 2 else "Лампа"} {i}', sku=f'PL-{i}', price=Decimal(100 * (i + 1)),
+            )
+            for i in range(7)
+        ]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def walk(self, params):
+        """Пройти все страницы вперёд, затем назад; вернуть (id вперёд, id назад)"""
+        url = reverse('product_list')
+        forward, pages = [], []
+        response = self.client.get(url, params)
+        while True:
+            page = response.context['page']
+            pages.append([product.id for product in page])
+            forward.extend(pages[-1])
+            if not page.has_next:
+                break
+            response = self.client.get(url, {**params, 'after': page.next_cursor})
+        backward = []
+        while page.has_previous:
+            response = self.client.get(url, {**params, 'before': page.prev_cursor})
+            page = response.context['page']
+            backward = [product.id for product in page] + backward
+        self.assertEqual(backward, [product_id for chunk in pages[:-1] for product_id in chunk])
+        return forward, backward
+
+    def test_walk_forward_and_back(self):
+        forward, _ = self.walk({'per_page': 2})
+        self.assertEqual(forward, [product.id for product in reversed(self.products)])
+
+    def test_garbage_cursor_returns_first_page(self):
+        first = self.client.get(reverse('product_list'), {'per_page': 3}).context['page']
+        for cursor in ('мусор', 'W10', 'WyJhYmMiXQ', '!!!'):
+            with self.subTest(cursor):
+                page = self.client.get(reverse('product_list'), {'per_page': 3, 'after': cursor}).context['page']
+                self.assertEqual([p.id for p in page], [p.id for p in first])
+                self.assertFalse(page.has_previous)
+
+    def test_cursor_with_price_filter_and_search(self):
+        forward, _ = self.walk({'per_page': 2, 'price_min': '200', 'price_max': '600'})
+        self.assertEqual(forward, [p.id for p in reversed(self.products[1:6])])
+
+        forward, _ = self.walk({'per_page': 1, 'search': 'Чайник', 'price_max': '600'})
+        self.assertEqual(forward, [p.id for p in reversed(self.products[:6]) if p.name.startswith('Чайник')])
+
+    def test_query_count_does_not_depend_on_page_depth(self):
+        url = reverse('product_list')
+        page = self.client.get(url, {'per_page': 2}).context['page']
+        # сессия, пользователь с профилем, страница товаров, диапазоны цен
+        with self.assertNumQueries(4):
+            self.client.get(url, {'per_page': 2})
+        while page.has_next:
+            with self.assertNumQueries(4):
+                page = self.client.get(url, {'per_page': 2, 'after': page.next_cursor}).context['page']
+
+
+class SearchTests(TestCase):
+    """Поиск товаров: порядок по релевантности и курсор по rank"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.kettle = Product.objects.create(name='Чайник электрический', sku='S-1', price=Decimal(1500))
+        cls.teapot = Product.objects.create(name='Чайник заварочный', sku='S-2', price=Decimal(700))
+        cls.stand = Product.objects.create(
+            name='Подставка', sku='S-3', price=Decimal(300), description='Подходит под любой Чайник',
+        )
+        cls.lamp = Product.objects.create(name='Лампа', sku='S-4', price=Decimal(900))
+
+    def search(self, query, **params):
+        return filter_catalog(Product.objects.all(), {'search': query, **params})
+
+    @skipIf(connection.vendor == 'postgresql', 'на PostgreSQL — полнотекстовый поиск')
+    def test_fallback_substring_search(self):
+        queryset, ordering = self.search('Чайник')
+        self.assertEqual(ordering, ('-rank', '-id'))
+        rows = list(queryset.order_by(*ordering))
+        self.assertEqual(rows, [self.stand, self.teapot, self.kettle])
+        self.assertEqual({product.rank for product in rows}, {0})
+
+        queryset, ordering = self.search('Чайник', price_max='1000')
+        self.assertEqual(list(queryset.order_by(*ordering)), [self.stand, self.teapot])
+
+    def test_cursor_over_rank(self):
+        queryset, ordering = self.search('Чайник')
+        paginator = KeysetPaginator(queryset, ordering, per_page=1)
+        seen, page = [], paginator.page()
+        while True:
+            seen.extend(page)
+            if not page.has_next:
+                break
+            page = paginator.page(after=page.next_cursor)
+        self.assertEqual(seen, list(queryset.order_by(*ordering)))
+        self.assertEqual(len(seen), 3)
+        back = paginator.page(before=page.prev_cursor)
+        self.assertEqual(list(back), seen[-2:-1])
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен PostgreSQL (tsvector, pg_trgm)')
+    def test_postgres_websearch_trigram_and_trigger(self):
+        queryset, ordering = self.search('чайники -заварочный')
+        rows = list(queryset.order_by(*ordering))
+        # Совпадение в названии (вес A) выше совпадения в описании (вес B)
+        self.assertEqual(rows, [self.kettle, self.stand])
+        self.assertGreater(rows[0].rank, rows[1].rank)
+
+        # Опечатка: находится по триграммам названия
+        queryset, ordering = self.search('лампп')
+        self.assertEqual(list(queryset.order_by(*ordering)), [self.lamp])
+
+        # Триггер обновляет search_vector при save()
+        self.lamp.name = 'Торшер'
+        self.lamp.save()
+        lamp = Product.objects.filter(pk=self.lamp.pk)
+        self.assertTrue(lamp.filter(search_vector=SearchQuery('торшер', config='russian')).exists())
+        self.assertFalse(lamp.filter(search_vector=SearchQuery('лампа', config='russian')).exists())
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('',                          views.product_list,  name='product_list'),
@@ -10,6 +10,14 @@ urlpatterns = [
     path('orders/',                   views.order_list,    name='order_list'),
     path('buy/<int:product_id>/<int:pickup_point_id>/',
          views.create_order, name='create_order'),
+    path('cart/',                     views.cart_view,     name='cart'),
+    path('cart/add/',                 views.cart_add,      name='cart_add'),
+    path('cart/<int:product_id>/remove/', views.cart_remove, name='cart_remove'),
+    path('cart/checkout/',            views.checkout,      name='checkout'),
+    
+    # Редактор и админ - выдача заказов на пункте выдачи
+    path('pickup/', views.pickup_desk, name='pickup_desk'),
+    path('pickup/deliver/', views.pickup_desk_deliver, name='pickup_desk_deliver'),
     
     # Редактор и админ - редактирование товаров
     path('product/<int:product_id>/edit/', views.edit_product, name='edit_product'),
@@ -20,4 +28,14 @@ urlpatterns = [
     path('users/', views.manage_users, name='manage_users'),
     path('user/<int:user_id>/edit-role/', views.edit_user_role, name='edit_user_role'),
     path('user/<int:user_id>/delete/', views.delete_user, name='delete_user'),
+    path('system/db-pool/', views.db_pool_stats, name='db_pool_stats'),
+    path('system/metrics/', views.metrics, name='metrics'),
+    path('export/products/', views.export_products, name='export_products'),
+    path('export/orders/', views.export_orders, name='export_orders'),
+    path('reports/', views.sales_report, name='sales_report'),
+
+    # JSON API каталога (только чтение)
+    path('api/products/', api.products, name='api_products'),
+    path('api/products/<int:product_id>/', api.product_detail, name='api_product_detail'),
+    path('api/pickup-points/', api.pickup_points, name='api_pickup_points'),
 ]
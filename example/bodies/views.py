@@ -1,70 +1,93 @@
+import re
+import tempfile
+from datetime import timedelta
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Prefetch, Q
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_POST
 
+from . import exports, reports
+from .cart import Cart
+from .metrics import render_prometheus
+from .objectcache import get_pickup_point_or_404, get_product_or_404, pickup_points
 from .forms import SimplifiedUserCreationForm
-from .models import Order, PickupPoint, Product, Profile
-from .models import Order, PickupPoint, Product, Profile
+from .models import Order, PriceBucket, Product, Profile
+from .pagination import KeysetPaginator, get_per_page
+from .pool import get_pool_stats
+from .prices import price_facets
+from .routers import replica_reads
+from .search import filter_catalog
 
 
-def get_user_role(user):
-    """Получить роль пользователя"""
-    if not user.is_authenticated:
-        return 'unauthorized'
-    try:
-        return user.profile.role
-    except Profile.DoesNotExist:
-        # Если профиль не существует, создаем его
-        profile = Profile.objects.create(user=user, role='authorized')
-        return profile.role
+def clean_price(value):
+    """Цена из формы как Decimal (запятая допускается); ValidationError, если не число"""
+    return Product._meta.get_field('price').clean(str(value).strip().replace(',', '.'), None)
 
 
 def require_role(allowed_roles):
-    """Декоратор для проверки роли пользователя"""
+    """Декоратор для проверки роли пользователя (синхронные и async-представления)"""
     def decorator(view_func):
-        def wrapper(request, *args, **kwargs):
-            user_role = get_user_role(request.user)
-            if user_role not in allowed_roles:
-                return HttpResponseForbidden("У вас нет прав доступа к этой странице")
-            return view_func(request, *args, **kwargs)
-        return wrapper
+        if iscoroutinefunction(view_func):
+            async def wrapper(request, *args, **kwargs):
+                if await request.arole() not in allowed_roles:
+                    return HttpResponseForbidden("У вас нет прав доступа к этой странице")
+                return await view_func(request, *args, **kwargs)
+        else:
+            def wrapper(request, *args, **kwargs):
+                if request.role not in allowed_roles:
+                    return HttpResponseForbidden("У вас нет прав доступа к этой странице")
+                return view_func(request, *args, **kwargs)
+        return wraps(view_func)(wrapper)
     return decorator
 
 
-def product_list(request):
+@replica_reads
+async def product_list(request):
     """Показать список товаров в зависимости от роли пользователя"""
-    user_role = get_user_role(request.user)
+    user_role = await request.arole()
     
     # Неавторизированный пользователь видит все товары без фильтрации
     products = Product.objects.all()
+    ordering = ('-id',)
     
     # Авторизированный/Редактор/Админ могут видеть с фильтрацией
     if user_role in ['authorized', 'editor', 'admin']:
-        search = request.GET.get('search', '')
-        price_min = request.GET.get('price_min', '')
-        price_max = request.GET.get('price_max', '')
-        
-        if search:
-            products = products.filter(name__icontains=search) | products.filter(description__icontains=search)
-        if price_min:
-            try:
-                products = products.filter(price__gte=float(price_min))
-            except ValueError:
-                pass
-        if price_max:
-            try:
-                products = products.filter(price__lte=float(price_max))
-            except ValueError:
-                pass
+        products, ordering = filter_catalog(products, request.GET)
+    
+    # Курсорная пагинация по -id (как в Product.Meta.ordering)
+    paginator = KeysetPaginator(products, ordering, get_per_page(request))
+    page = await paginator.apage(after=request.GET.get('after'), before=request.GET.get('before'))
     
     context = {
-        'products': products,
-        'user_role': user_role,
+        'products': page,
+        'page': page,
+        'can_order': user_role in ['authorized', 'editor', 'admin'],
+        # Карточки товаров кэшируются отдельно для каждой роли
+        'card_variant': user_role,
+        'card_cache_timeout': settings.PRODUCT_CARD_CACHE_TIMEOUT,
         'show_edit': user_role in ['editor', 'admin'],
         'show_delete': user_role == 'admin',
         'show_add_product': user_role == 'admin',
     }
+    if user_role in ['authorized', 'editor', 'admin']:
+        # Готовые счётчики по диапазонам цен (bodies.prices)
+        context['price_facets'] = price_facets([bucket async for bucket in PriceBucket.objects.all()])
     return render(request, 'products.html', context)
 
 
@@ -73,8 +96,8 @@ def register_view(request):
     if request.method == 'POST':
         form = SimplifiedUserCreationForm(request.POST)
         if form.is_valid():
+            # Профиль создаётся сигналом post_save
             user = form.save()
-            Profile.objects.get_or_create(user=user, defaults={'role': 'authorized'})
             login(request, user)
             return redirect('product_list')
     else:
@@ -105,53 +128,161 @@ def logout_view(request):
 
 @login_required(login_url='login')
 @require_role(['authorized', 'editor', 'admin'])
-def order_list(request):
+@replica_reads
+async def order_list(request):
     """Показать заказы пользователя"""
-    orders = Order.objects.filter(user=request.user)
-    return render(request, 'order_list.html', {'orders': orders})
+    orders = (
+        Order.objects.filter(user=request.user)
+        .select_related('pickupPoint')
+        .prefetch_related(Prefetch('products', queryset=Product.objects.only('sku')))
+    )
+    paginator = KeysetPaginator(orders, ('-createdAt', '-id'), get_per_page(request))
+    page = await paginator.apage(after=request.GET.get('after'), before=request.GET.get('before'))
+    return render(request, 'order_list.html', {'orders': page, 'page': page})
 
 
 @login_required(login_url='login')
 @require_role(['authorized', 'editor', 'admin'])
+@require_POST
 def create_order(request, product_id, pickup_point_id):
-    """Создать новый заказ"""
-    product      = get_object_or_404(Product, id=product_id)
-    pickup_point = get_object_or_404(PickupPoint, id=pickup_point_id)
+    """Создать новый заказ из одного товара"""
+    product      = get_product_or_404(product_id)
+    pickup_point = get_pickup_point_or_404(pickup_point_id)
     
-    order = Order.objects.create(user=request.user, pickupPoint=pickup_point)
-    order.products.add(product)
+    Order.place(request.user, pickup_point, [product])
     
     return redirect('order_list')
 
 
+@login_required(login_url='login')
+@require_role(['authorized', 'editor', 'admin'])
+def cart_view(request):
+    """Показать корзину"""
+    cart = Cart(request)
+    products = Product.objects.filter(id__in=list(cart)) if cart else []
+    return render(request, 'cart.html', {
+        'products': products,
+        'pickup_points': pickup_points(),
+        'error': request.GET.get('error'),
+    })
+
+
+@login_required(login_url='login')
+@require_role(['authorized', 'editor', 'admin'])
+@require_POST
+def cart_add(request):
+    """Добавить товар в корзину"""
+    try:
+        Cart(request).add(int(request.POST.get('product_id', '')))
+    except ValueError:
+        pass
+    return redirect('cart')
+
+
+@login_required(login_url='login')
+@require_role(['authorized', 'editor', 'admin'])
+@require_POST
+def cart_remove(request, product_id):
+    """Убрать товар из корзины"""
+    Cart(request).remove(product_id)
+    return redirect('cart')
+
+
+@login_required(login_url='login')
+@require_role(['authorized', 'editor', 'admin'])
+@require_POST
+def checkout(request):
+    """Оформить заказ из всех товаров корзины"""
+    cart = Cart(request)
+    if not cart:
+        return redirect('cart')
+    
+    # Все товары корзины проверяются одним запросом
+    products = list(Product.objects.filter(id__in=list(cart)).only('id'))
+    if len(products) != len(cart):
+        found = {product.id for product in products}
+        for product_id in [pid for pid in cart if pid not in found]:
+            cart.remove(product_id)
+        return redirect(reverse('cart') + '?error=missing')
+    
+    pickup_point = get_pickup_point_or_404(request.POST.get('pickup_point_id'))
+    Order.place(request.user, pickup_point, products)
+    cart.clear()
+    return redirect('order_list')
+
+
+@login_required(login_url='login')
+@require_role(['editor', 'admin'])
+def pickup_desk(request):
+    """Выдача заказов: поиск по пункту выдачи и кодам получения"""
+    pickup_point_id = request.GET.get('pickup_point', '')
+    codes_text = request.GET.get('codes', '')
+    codes = list(dict.fromkeys(code.upper() for code in re.split(r'[\s,;]+', codes_text) if code))
+    
+    orders = []
+    if pickup_point_id.isdigit() and codes:
+        # Каждый код — поиск по уникальному индексу (pickupPoint, receiveCode)
+        orders = (
+            Order.objects.filter(pickupPoint_id=pickup_point_id, receiveCode__in=codes[:100])
+            .select_related('user')
+            .prefetch_related(Prefetch('products', queryset=Product.objects.only('sku')))
+        )
+    
+    return render(request, 'pickup_desk.html', {
+        'pickup_points': pickup_points(),
+        'pickup_point_id': pickup_point_id,
+        'codes': codes_text,
+        'orders': orders,
+        'delivered': request.GET.get('delivered'),
+    })
+
+
+@login_required(login_url='login')
+@require_role(['editor', 'admin'])
+@require_POST
+def pickup_desk_deliver(request):
+    """Отметить выбранные заказы выданными (один UPDATE)"""
+    pickup_point_id = request.POST.get('pickup_point', '')
+    order_ids = [int(pk) for pk in request.POST.getlist('order') if pk.isdigit()]
+    delivered = 0
+    if pickup_point_id.isdigit() and order_ids:
+        delivered = Order.objects.filter(id__in=order_ids, pickupPoint_id=pickup_point_id).mark_delivered()
+    query = urlencode({'pickup_point': pickup_point_id, 'delivered': delivered})
+    return redirect(reverse('pickup_desk') + '?' + query)
+
+
 @login_required(login_url='login')
 @require_role(['editor', 'admin'])
 def edit_product(request, product_id):
     """Редактировать товар"""
-    product = get_object_or_404(Product, id=product_id)
+    if request.method != 'POST':
+        # Форма показывается из кэша объектов; изменения — только по строке из основной базы
+        return render(request, 'edit_product.html', {'product': get_product_or_404(product_id)})
     
-    if request.method == 'POST':
+    with transaction.atomic():
+        product = get_object_or_404(Product.objects.select_for_update(), id=product_id)
         product.name = request.POST.get('name', product.name)
-        product.price = request.POST.get('price', product.price)
         product.description = request.POST.get('description', product.description)
         product.sku = request.POST.get('sku', product.sku)
+        try:
+            product.price = clean_price(request.POST.get('price', product.price))
+        except ValidationError as e:
+            return render(request, 'edit_product.html', {'product': product, 'error': e.messages[0]}, status=400)
         product.save()
-        return redirect('product_list')
-    
-    return render(request, 'edit_product.html', {'product': product})
+    return redirect('product_list')
 
 
 @login_required(login_url='login')
 @require_role(['admin'])
 def delete_product(request, product_id):
     """Удалить товар"""
-    product = get_object_or_404(Product, id=product_id)
-    
-    if request.method == 'POST':
-        product.delete()
-        return redirect('product_list')
+    if request.method != 'POST':
+        product = get_product_or_404(product_id)
+        return render(request, 'confirm_delete.html', {'object': product, 'object_type': 'товара'})
     
-    return render(request, 'confirm_delete.html', {'object': product, 'object_type': 'товара'})
+    with transaction.atomic():
+        get_object_or_404(Product.objects.select_for_update(), id=product_id).delete()
+    return redirect('product_list')
 
 
 @login_required(login_url='login')
@@ -159,12 +290,16 @@ def delete_product(request, product_id):
 def add_product(request):
     """Добавить новый товар"""
     if request.method == 'POST':
-        Product.objects.create(
+        product = Product(
             name=request.POST.get('name', ''),
-            price=request.POST.get('price', 0),
             description=request.POST.get('description', ''),
             sku=request.POST.get('sku', '')
         )
+        try:
+            product.price = clean_price(request.POST.get('price', ''))
+        except ValidationError as e:
+            return render(request, 'add_product.html', {'product': product, 'error': e.messages[0]}, status=400)
+        product.save()
         return redirect('product_list')
     
     return render(request, 'add_product.html')
@@ -172,11 +307,37 @@ def add_product(request):
 
 @login_required(login_url='login')
 @require_role(['admin'])
-def manage_users(request):
-    """Управление пользователями (показ списка)"""
+@replica_reads
+async def manage_users(request):
+    """Управление пользователями: поиск по началу логина, фильтр по роли, страницы"""
     from django.contrib.auth.models import User
-    users = User.objects.all()
-    return render(request, 'manage_users.html', {'users': users})
+    search = request.GET.get('search', '').strip()
+    role = request.GET.get('role', '')
+    roles = dict(Profile.ROLE_CHOICES)
+
+    users = User.objects.select_related('profile')
+    if search:
+        # Индекс auth_user_username_prefix_idx (миграция 0009)
+        users = users.filter(username__istartswith=search)
+    if role in roles:
+        users = users.filter(profile__role=role)
+
+    # Число пользователей по ролям — один агрегирующий запрос
+    counts = await User.objects.aaggregate(
+        total=Count('id'),
+        **{key: Count('id', filter=Q(profile__role=key)) for key in roles},
+    )
+
+    paginator = KeysetPaginator(users, ('username',), get_per_page(request))
+    page = await paginator.apage(after=request.GET.get('after'), before=request.GET.get('before'))
+    return render(request, 'manage_users.html', {
+        'users': page,
+        'page': page,
+        'search': search,
+        'role': role if role in roles else '',
+        'role_counts': [(key, label, counts[key]) for key, label in Profile.ROLE_CHOICES],
+        'total': counts['total'],
+    })
 
 
 @login_required(login_url='login')
@@ -184,7 +345,7 @@ def manage_users(request):
 def edit_user_role(request, user_id):
     """Изменить роль пользователя"""
     from django.contrib.auth.models import User
-    user = get_object_or_404(User, id=user_id)
+    user = get_object_or_404(User.objects.select_related('profile'), id=user_id)
     profile = user.profile
     
     if request.method == 'POST':
@@ -211,3 +372,93 @@ def delete_user(request, user_id):
         return redirect('manage_users')
     
     return render(request, 'confirm_delete.html', {'object': user, 'object_type': 'пользователя'})
+
+
+@login_required(login_url='login')
+@require_role(['admin'])
+def db_pool_stats(request):
+    """Пулы соединений: размер, занятые/свободные, ожидание (мс)"""
+    return JsonResponse(get_pool_stats())
+
+
+@login_required(login_url='login')
+@require_role(['admin'])
+def metrics(request):
+    """Метрики процесса в формате Prometheus (см. bodies.metrics)"""
+    return HttpResponse(render_prometheus(get_pool_stats()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def export_response(request, name, table, atable):
+    """Ответ с выгрузкой: CSV потоком, XLSX — готовым файлом (?format=csv|xlsx)"""
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in exports.FORMATS:
+        return HttpResponseBadRequest('format: csv или xlsx')
+    filename = exports.export_filename(name, fmt)
+    if fmt == 'xlsx':
+        # Книга пишется на диск; FileResponse закроет (и удалит) файл после отправки
+        file = tempfile.TemporaryFile()
+        exports.write_xlsx(table(), file, name)
+        file.seek(0)
+        return FileResponse(file, as_attachment=True, filename=filename, content_type=exports.FORMATS[fmt])
+    if isinstance(request, ASGIRequest):
+        # Под ASGI синхронный итератор был бы прочитан целиком до отправки
+        content = exports.acsv_chunks(atable())
+    else:
+        content = exports.csv_chunks(table())
+    return StreamingHttpResponse(content, content_type=exports.FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+    })
+
+
+@login_required(login_url='login')
+@require_role(['admin'])
+def export_products(request):
+    """Выгрузка товаров (формат import_products.py)"""
+    return export_response(request, 'products', exports.product_table, exports.aproduct_table)
+
+
+@login_required(login_url='login')
+@require_role(['admin'])
+def export_orders(request):
+    """Выгрузка заказов с артикулами; ?since=ГГГГ-ММ-ДД&until=ГГГГ-ММ-ДД"""
+    try:
+        since = parse_date(request.GET.get('since', ''))
+        until = parse_date(request.GET.get('until', ''))
+    except ValueError:
+        return HttpResponseBadRequest('since/until: дата ГГГГ-ММ-ДД')
+    return export_response(
+        request, 'orders',
+        lambda: exports.order_table(since, until),
+        lambda: exports.aorder_table(since, until),
+    )
+
+
+REPORT_PERIODS = (7, 30, 90, 365)
+
+
+@login_required(login_url='login')
+@require_role(['editor', 'admin'])
+def sales_report(request):
+    """Отчёт по продажам за период: только накопительные таблицы (bodies.reports)"""
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        days = 30
+    if days not in REPORT_PERIODS:
+        days = 30
+    until = timezone.localdate()
+    since = until - timedelta(days=days - 1)
+    daily = reports.daily_orders(since, until)
+    return render(request, 'sales_report.html', {
+        'days': days,
+        'periods': REPORT_PERIODS,
+        'since': since,
+        'until': until,
+        'daily': [
+            {'day': day, 'new': counts.get('new', 0), 'delivered': counts.get('delivered', 0), 'total': total}
+            for day, counts, total in daily
+        ],
+        'total': sum(total for _, _, total in daily),
+        'pickup_points': reports.top_pickup_points(since, until),
+        'products': reports.top_products(since, until),
+    })
@@ -0,0 +1,25 @@
+"""
+Профиль запуска под ASGI: gunicorn управляет процессами, uvicorn обслуживает
+event loop в каждом из них.
+
+    pip install -r requirements-asgi.txt
+    gunicorn config.asgi:application -c config/gunicorn_asgi.py
+
+Все параметры можно переопределить переменными окружения.
+"""
+
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Один процесс на ядро: параллельность внутри процесса даёт event loop
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+# Медленные клиенты не держат поток, поэтому таймауты можно делать большими
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Перезапуск воркеров ограничивает рост памяти при долгой работе
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+accesslog = '-'
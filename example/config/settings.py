@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,16 +38,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     'bodies',
 ]
 
 MIDDLEWARE = [
+    'bodies.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'bodies.routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bodies.middleware.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -63,6 +68,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'bodies.context_processors.role',
             ],
         },
     },
@@ -74,17 +80,99 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+# Connection pooling (psycopg_pool). Each process keeps DB_POOL_MIN_SIZE..
+# DB_POOL_MAX_SIZE open connections; requests borrow one instead of paying a
+# TCP + auth handshake. Set DB_POOL=0 to fall back to persistent connections
+# (CONN_MAX_AGE) with health checks.
+DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+
+DB_POOL_OPTIONS = {
+    'min_size': env_int('DB_POOL_MIN_SIZE', 2),
+    'max_size': env_int('DB_POOL_MAX_SIZE', 10),
+    # Сколько ждать свободное соединение, прежде чем вернуть ошибку
+    'timeout': env_float('DB_POOL_TIMEOUT', 10),
+    # Закрывать простаивающие и слишком старые соединения
+    'max_idle': env_float('DB_POOL_MAX_IDLE', 600),
+    'max_lifetime': env_float('DB_POOL_MAX_LIFETIME', 3600),
+    'reconnect_timeout': env_float('DB_POOL_RECONNECT_TIMEOUT', 300),
+}
+
+
+def database(host, port):
+    options = {'connect_timeout': env_int('DB_CONNECT_TIMEOUT', 5)}
+    config = {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'shop',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'NAME': os.environ.get('DB_NAME', 'shop'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
+        'HOST': host,
+        'PORT': port,
+        'OPTIONS': options,
+        # С пулом — проверка соединения при выдаче из пула (check_connection),
+        # без пула — проверка переиспользуемого соединения в начале запроса
+        'CONN_HEALTH_CHECKS': True,
     }
+    if DB_POOL:
+        options['pool'] = dict(DB_POOL_OPTIONS)
+    else:
+        config['CONN_MAX_AGE'] = env_int('DB_CONN_MAX_AGE', 60)
+    return config
+
+
+DATABASES = {
+    'default': database(os.environ.get('DB_HOST', 'localhost'), os.environ.get('DB_PORT', '5432')),
 }
 
+# Read replicas: DB_REPLICA_HOSTS="replica1:5432,replica2:5432" — streaming
+# replicas of the primary (they are never migrated: schema and data come
+# through replication). bodies.routers sends reads of the listing views to a
+# random replica and everything else to 'default'; a client stays on
+# 'default' for REPLICA_PIN_SECONDS after it writes.
+# In tests the replicas mirror 'default'.
+def replica(spec):
+    replica_host, _, replica_port = spec.partition(':')
+    config = database(replica_host, replica_port or '5432')
+    config['TEST'] = {'MIRROR': 'default'}
+    return config
+
+
+DATABASE_REPLICAS = []
+for number, spec in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica_{number}'] = replica(spec.strip())
+    DATABASE_REPLICAS.append(f'replica_{number}')
+
+DATABASE_ROUTERS = ['bodies.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = env_int('REPLICA_PIN_SECONDS', 5)
+
+
+# Sessions
+# SESSION_STORE=db (default) | cache | cached_db. 'cache' keeps sessions only
+# in CACHES (use Redis in production: the local-memory cache is per process);
+# 'cached_db' reads from the cache and writes through to the database.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get('SESSION_STORE', 'db')
+
+
+# Authentication
+# Пользователь загружается вместе с профилем (роль) одним запросом
+
+AUTHENTICATION_BACKENDS = ['bodies.backends.ProfileModelBackend']
+
+# last_login is written at most once per interval (seconds); empty or 'off'
+# disables it. See bodies.signals.update_last_login_throttled.
+LAST_LOGIN_UPDATE_INTERVAL = (
+    None if os.environ.get('LAST_LOGIN_UPDATE_INTERVAL', '3600') in ('', 'off')
+    else env_int('LAST_LOGIN_UPDATE_INTERVAL', 3600)
+)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -125,11 +213,63 @@ STATIC_URL = 'static/'
 # Media files (User uploads)
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
-import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'bodies', 'static', 'images')
 
+# Media is served by bodies.media.serve_media (ETag, 304, Range, Cache-Control).
+# Behind nginx set MEDIA_ACCEL_REDIRECT_PREFIX to an `internal` location
+# aliased to MEDIA_ROOT so nginx sends the file itself (sendfile).
+SERVE_MEDIA = os.environ.get('SERVE_MEDIA', '1') == '1'
+MEDIA_CACHE_MAX_AGE = 60 * 60
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Pagination
+# Размер страницы каталога и верхняя граница для параметра ?per_page=
+
+PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+# JSON API (bodies.api) отдаёт большие страницы потоком
+API_MAX_PAGE_SIZE = 1000
+
+# Cache
+# Фрагменты карточек товаров (products.html) кэшируются по id, версии и роли
+
+PRODUCT_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Кэш товаров и пунктов выдачи (bodies.objectcache): срок жизни объекта, с
+# LocMemCache — и срок, за который другие процессы увидят изменения
+OBJECT_CACHE_TIMEOUT = env_int('OBJECT_CACHE_TIMEOUT', 300)
+
+# Metered backends count hits and misses for /system/metrics/.
+# For Redis use 'bodies.metrics.MeteredRedisCache' with LOCATION='redis://...'.
+CACHES = {
+    'default': {
+        'BACKEND': 'bodies.metrics.MeteredLocMemCache',
+    },
+}
+
+# Metrics
+# Доля запросов, для которых считаются время, SQL, кэш и размер ответа
+# (bodies.metrics); 0 — выключено, 1 — все запросы
+
+METRICS_SAMPLE_RATE = env_float('METRICS_SAMPLE_RATE', 0.1)
+
+
+# Logging
+# Итоги замеров производительности (bodies.benchmarks) — в консоль
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'bodies.benchmarks': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
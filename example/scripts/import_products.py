@@ -1,8 +1,21 @@
 #!/usr/bin/env python
+"""
+Импорт товаров из CSV или XLSX.
+
+Файл читается потоково, порциями по CHUNK_SIZE строк (XLSX — в режиме
+read-only openpyxl, без загрузки всей книги в память). Каждая порция
+записывается в одной транзакции: один SELECT существующих артикулов и
+один INSERT ... ON CONFLICT (sku) DO UPDATE для новых и изменённых товаров.
+
+    python scripts/import_products.py data/products_from_exam.csv [--chunk-size 5000]
+    python scripts/import_products.py data/products_template.xlsx
+"""
+import argparse
 import csv
 import os
 import sys
-from decimal import Decimal
+import time
+from itertools import islice
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -12,7 +25,14 @@ import django
 
 django.setup()
 
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from openpyxl import load_workbook
+
+from bodies.catalog import bump_catalog_version
 from bodies.models import Product
+from bodies.objectcache import invalidate_products
+from bodies.prices import apply_deltas, price_change_deltas
 
 COLUMNS = {
     'name': ['name', 'Название', 'название'],
@@ -21,12 +41,128 @@ COLUMNS = {
     'description': ['description', 'Описание', 'описание'],
 }
 
+CHUNK_SIZE = 5000
 
-def find_col(row, key):
-    return next((row[k].strip() for k in COLUMNS[key] if row.get(k, '').strip()), None)
+UPDATE_FIELDS = ['name', 'price', 'description', 'version']
+
+
+class ImportStats:
+    """Итоги импорта"""
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.rejected = []  # (номер строки, причина)
+        self.started = time.monotonic()
+
+    @property
+    def processed(self):
+        return self.inserted + self.updated + self.unchanged + len(self.rejected)
 
+    @property
+    def throughput(self):
+        elapsed = time.monotonic() - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
 
-def import_csv(file_path):
+    def reject(self, line, reason):
+        self.rejected.append((line, reason))
+
+    def report(self, out=None):
+        """Напечатать итоги в ``out`` (по умолчанию — текущий sys.stdout)"""
+        out = out or sys.stdout
+        for line, reason in self.rejected:
+            print(f'строка {line}: {reason}', file=out)
+        print(
+            f'добавлено: {self.inserted}, обновлено: {self.updated}, '
+            f'без изменений: {self.unchanged}, отклонено: {len(self.rejected)}',
+            file=out,
+        )
+        print(f'{self.processed} строк за {time.monotonic() - self.started:.1f} с '
+              f'({self.throughput:.0f} строк/с)', file=out)
+
+
+def find_col(row, key):
+    return next((row[k].strip() for k in COLUMNS[key] if (row.get(k) or '').strip()), None)
+
+
+def clean_row(row):
+    """Проверить строку по полям модели; вернуть словарь значений или ValidationError"""
+    values = {key: find_col(row, key) for key in COLUMNS}
+    missing = [key for key in ('name', 'sku', 'price') if not values[key]]
+    if missing:
+        raise ValidationError(f'не заполнено: {", ".join(missing)}')
+    values['price'] = values['price'].replace(',', '.')
+    values['description'] = values['description'] or ''
+    return {
+        key: Product._meta.get_field(key).clean(value, None)
+        for key, value in values.items()
+    }
+
+
+def write_chunk(chunk, stats):
+    """Записать порцию строк [(номер строки, row), ...] одной транзакцией"""
+    cleaned = {}
+    lines = {}
+    for line, row in chunk:
+        try:
+            values = clean_row(row)
+        except ValidationError as e:
+            stats.reject(line, '; '.join(e.messages))
+            continue
+        sku = values['sku']
+        if sku in cleaned:
+            # Повтор артикула в файле: побеждает последняя строка
+            stats.reject(lines[sku], f'артикул {sku} повторяется в строке {line}')
+        cleaned[sku] = values
+        lines[sku] = line
+    if not cleaned:
+        return
+
+    with transaction.atomic():
+        existing = {
+            p.sku: p for p in
+            Product.objects.filter(sku__in=cleaned).only('sku', 'name', 'price', 'description')
+        }
+        version = Product.next_version()
+        to_write = []
+        old_prices = []
+        for sku, values in cleaned.items():
+            current = existing.get(sku)
+            if current is None:
+                stats.inserted += 1
+            elif all(getattr(current, key) == values[key] for key in ('name', 'price', 'description')):
+                stats.unchanged += 1
+                continue
+            else:
+                stats.updated += 1
+            to_write.append(Product(version=version, **values))
+            old_prices.append(current.price if current else None)
+
+        Product.objects.bulk_create(
+            to_write,
+            update_conflicts=True,
+            unique_fields=['sku'],
+            update_fields=UPDATE_FIELDS,
+        )
+        # bulk_create не вызывает сигналы: счётчики цен, версия каталога и кэш объектов — здесь
+        apply_deltas(price_change_deltas(old_prices, [product.price for product in to_write]))
+        if to_write:
+            bump_catalog_version()
+            invalidate_products([existing[p.sku].pk for p in to_write if p.sku in existing])
+
+
+def import_rows(rows, chunk_size=CHUNK_SIZE, stats=None):
+    """Импортировать поток строк (номер строки, словарь колонок)"""
+    stats = stats or ImportStats()
+    rows = iter(rows)
+    while chunk := list(islice(rows, chunk_size)):
+        write_chunk(chunk, stats)
+    return stats
+
+
+def read_csv(file_path):
+    """Построчно читать CSV, определив кодировку и разделитель"""
     for enc in ['utf-8-sig', 'utf-8', 'cp1251', 'latin-1']:
         try:
             open(file_path, encoding=enc).read(1024)
@@ -34,29 +170,54 @@ def import_csv(file_path):
         except (UnicodeDecodeError, UnicodeError):
             enc = 'utf-8'
 
-    with open(file_path, encoding=enc) as f:
+    with open(file_path, encoding=enc, newline='') as f:
         dialect = csv.Sniffer().sniff(f.read(1024), delimiters=',;\t')
         f.seek(0)
-        imported = 0
+        yield from enumerate(csv.DictReader(f, dialect=dialect), 2)
 
-        for i, row in enumerate(csv.DictReader(f, dialect=dialect), 2):
-            name, sku, price = find_col(row, 'name'), find_col(row, 'sku'), find_col(row, 'price')
-            if not all([name, sku, price]):
-                continue
-            try:
-                price = Decimal(price.replace(',', '.'))
-            except Exception:
-                continue
 
-            _, created = Product.objects.update_or_create(
-                sku=sku,
-                defaults={'name': name, 'price': price, 'description': find_col(row, 'description') or ''}
-            )
-            imported += 1
+def cell_text(value):
+    """Значение ячейки Excel как строка (45000.0 -> '45000')"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
 
-    return imported
 
+def read_xlsx(file_path):
+    """Построчно читать первый лист XLSX; первая строка — заголовки"""
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [cell_text(value).strip() for value in next(rows, ())]
+        for line, values in enumerate(rows, 2):
+            if any(value is not None for value in values):
+                yield line, dict(zip(header, map(cell_text, values)))
+    finally:
+        workbook.close()
+
+
+# import_csv/import_xlsx/import_file возвращают ImportStats; прежнее число
+# импортированных товаров — stats.inserted + stats.updated
+def import_csv(file_path, chunk_size=CHUNK_SIZE):
+    return import_rows(read_csv(file_path), chunk_size)
 
-if __name__ == '__main__':
-    print(import_csv(sys.argv[1]))
 
+def import_xlsx(file_path, chunk_size=CHUNK_SIZE):
+    return import_rows(read_xlsx(file_path), chunk_size)
+
+
+def import_file(file_path, chunk_size=CHUNK_SIZE):
+    """Выбрать формат по расширению файла"""
+    if Path(file_path).suffix.lower() in ('.xlsx', '.xlsm'):
+        return import_xlsx(file_path, chunk_size)
+    return import_csv(file_path, chunk_size)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Импорт товаров из CSV/XLSX')
+    parser.add_argument('file')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    import_file(args.file, args.chunk_size).report()